@@ -0,0 +1,96 @@
+"""
+Microbenchmark of the playlist parser on large generated playlists.
+
+    python benchmarks/bench_m3u8.py
+
+Parses media playlists of growing length (with byte ranges, keys, init
+sections and discontinuities) and master playlists with growing attribute
+lists, and compares the attribute tokeniser with the lookahead regex the
+former parser split attribute lists with.
+"""
+import os
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from echo360 import m3u8  # noqa: E402
+
+# the former tokeniser: rescans the rest of the line at every comma
+_LOOKAHEAD_RE = re.compile(r",(?=(?:[^\"']*[\"'][^\"']*[\"'])*[^\"']*$)")
+
+
+def media_playlist(segments):
+    lines = [
+        "#EXTM3U",
+        "#EXT-X-VERSION:7",
+        "#EXT-X-TARGETDURATION:6",
+        "#EXT-X-MEDIA-SEQUENCE:0",
+        '#EXT-X-MAP:URI="init.mp4"',
+    ]
+    for i in range(segments):
+        if i % 500 == 0:
+            lines.append("#EXT-X-DISCONTINUITY")
+            lines.append(
+                '#EXT-X-KEY:METHOD=NONE,KEYFORMAT="identity",KEYFORMATVERSIONS="1"'
+            )
+        lines.append("#EXTINF:6.006,")
+        lines.append("#EXT-X-BYTERANGE:{}@{}".format(188 * 1000, i * 188 * 1000))
+        lines.append("media_{}.ts?token=abcdef0123456789".format(i // 100))
+    lines.append("#EXT-X-ENDLIST")
+    return "\n".join(lines) + "\n"
+
+
+def master_playlist(variants, attributes):
+    lines = ["#EXTM3U", "#EXT-X-VERSION:7"]
+    extra = ",".join('X-ATTR-{}="v{},{}"'.format(i, i, i) for i in range(attributes))
+    for i in range(variants):
+        lines.append(
+            '#EXT-X-MEDIA:TYPE=AUDIO,GROUP-ID="q{}",NAME="Default",DEFAULT=YES,'
+            'URI="s0q{}.m3u8"'.format(i, i)
+        )
+        lines.append(
+            '#EXT-X-STREAM-INF:BANDWIDTH={},RESOLUTION=1920x1080,AUDIO="q{}",'
+            'CODECS="avc1.640029,mp4a.40.2",{}'.format(100000 * (i + 1), i, extra)
+        )
+        lines.append("s1q{}.m3u8".format(i))
+    return "\n".join(lines) + "\n"
+
+
+def best(stmt, number):
+    return min(timeit.repeat(stmt, number=number, repeat=5)) / number
+
+
+def main():
+    url = "https://example.com/lecture/master.m3u8"
+    print("media playlist          parse      per segment")
+    for segments in (1000, 10000, 100000):
+        text = media_playlist(segments)
+        number = max(1, 20000 // segments)
+        seconds = best(lambda: m3u8.parse(text, url), number)
+        print(
+            "  {:>7} segments  {:8.2f} ms  {:8.2f} us".format(
+                segments, seconds * 1e3, seconds / segments * 1e6
+            )
+        )
+
+    print("attribute list          tokeniser  lookahead split")
+    for attributes in (10, 100, 1000):
+        line = master_playlist(1, attributes).splitlines()[3].partition(":")[2]
+        number = max(1, 2000 // attributes)
+        new = best(lambda: m3u8.parse_attributes(line), number)
+        old = best(lambda: _LOOKAHEAD_RE.split(line), number)
+        print(
+            "  {:>7} attributes {:8.3f} ms  {:8.3f} ms".format(
+                attributes, new * 1e3, old * 1e3
+            )
+        )
+
+    text = master_playlist(20, 100)
+    seconds = best(lambda: m3u8.parse(text, url), 100)
+    print("master playlist, 20 variants: {:.3f} ms".format(seconds * 1e3))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,11 @@
 import re
 import sys
+
+# gevent has to monkey patch before requests (and ssl) are imported
+from echo360.backends import patch_gevent_if_requested
+
+patch_gevent_if_requested(sys.argv)
+
 from echo360.main import main
 import fire
 
@@ -0,0 +1,305 @@
+"""
+Execution backends for fetching segments concurrently.
+
+All backends run the (synchronous) download workers ``pool_size`` at a time,
+they differ in how the blocking HTTP calls are made to overlap:
+
+- ``thread``:  a plain thread pool, works everywhere.
+- ``gevent``:  greenlets; requires ``gevent.monkey.patch_all()`` to have run
+               before ``requests``/``ssl`` are imported (see ``patch_gevent``),
+               otherwise every request blocks the whole hub.
+- ``asyncio``: all HTTP traffic is multiplexed on one asyncio event loop with
+               the non-blocking ``aiohttp`` client (optional dependency).
+
+NOTE: this module must not import requests at the top level, as it is used by
+the entry point to monkey patch before anything else gets imported.
+"""
+import logging
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+_LOGGER = logging.getLogger(__name__)
+
+BACKENDS = ("thread", "gevent", "asyncio")
+DEFAULT_BACKEND = "thread"
+
+# self-check results, so that each backend is only checked once per process
+_CHECKED = {}
+
+
+def patch_gevent():
+    """Monkey patch the standard library for gevent (no-op if already done)."""
+    from gevent import monkey
+
+    if not monkey.is_module_patched("socket"):
+        if "ssl" in sys.modules or "requests" in sys.modules:
+            _LOGGER.debug(
+                "Monkey patching gevent after ssl/requests has been imported, "
+                "requests may not overlap."
+            )
+        monkey.patch_all()
+
+
+def patch_gevent_if_requested(argv):
+    """
+    Called by the entry point before importing anything else, so that the
+    gevent backend gets a properly patched ``socket`` and ``ssl``.
+    """
+    for i, arg in enumerate(argv):
+        if arg in ("--backend=gevent", "-backend=gevent") or (
+            arg in ("--backend", "-backend")
+            and i + 1 < len(argv)
+            and argv[i + 1] == "gevent"
+        ):
+            patch_gevent()
+            return True
+    return False
+
+
+class ThreadBackend(object):
+    name = "thread"
+
+    def __init__(self, pool_size):
+        self.pool_size = pool_size
+
+    def map(self, fn, items):
+        with ThreadPoolExecutor(max_workers=self.pool_size) as executor:
+            # consume the results so that worker exceptions are raised here
+            return list(executor.map(fn, items))
+
+    def wrap_session(self, session):
+        return session
+
+    def close(self):
+        pass
+
+    def _probe(self, delay):
+        time.sleep(delay)
+
+    def self_check(self, tasks=4, delay=0.05):
+        """
+        Checks that blocking calls made by workers really overlap, i.e. that
+        ``tasks`` calls sleeping ``delay`` each take about ``delay`` in total.
+        """
+        tasks = max(2, min(tasks, self.pool_size))
+        if self.pool_size < 2:
+            return True
+        start = time.monotonic()
+        self.map(lambda _: self._probe(delay), range(tasks))
+        elapsed = time.monotonic() - start
+        _LOGGER.debug(
+            "Backend %s self-check: %d x %.2fs took %.2fs",
+            self.name,
+            tasks,
+            delay,
+            elapsed,
+        )
+        return elapsed < tasks * delay / 2
+
+
+class GeventBackend(ThreadBackend):
+    name = "gevent"
+
+    def __init__(self, pool_size):
+        super(GeventBackend, self).__init__(pool_size)
+        from gevent import monkey
+        from gevent.pool import Pool
+
+        if not monkey.is_module_patched("socket"):
+            _LOGGER.warning(
+                "gevent backend selected but socket is not monkey patched, "
+                "requests will not overlap."
+            )
+        self.pool = Pool(pool_size)
+
+    def map(self, fn, items):
+        return self.pool.map(fn, items)
+
+
+class AsyncioBackend(ThreadBackend):
+    """
+    Runs an asyncio event loop in a background thread, with a single aiohttp
+    client session performing all HTTP I/O. Workers stay synchronous: they are
+    run on a thread pool and wait on the loop for their response, so the rest
+    of the download pipeline is shared with the other backends.
+    """
+
+    name = "asyncio"
+
+    def __init__(self, pool_size):
+        super(AsyncioBackend, self).__init__(pool_size)
+        try:
+            import aiohttp  # noqa: F401
+        except ImportError:
+            raise ImportError(
+                'The asyncio backend requires "aiohttp", install it with '
+                "`pip install aiohttp`."
+            )
+        import asyncio
+
+        self._asyncio = asyncio
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(
+            target=self._loop.run_forever, name="echo360-asyncio", daemon=True
+        )
+        self._thread.start()
+        self._sessions = []
+
+    def run(self, coroutine):
+        """Runs ``coroutine`` on the event loop and waits for its result."""
+        return self._asyncio.run_coroutine_threadsafe(coroutine, self._loop).result()
+
+    def wrap_session(self, session):
+        wrapped = AiohttpSession(self, session, self.pool_size)
+        self._sessions.append(wrapped)
+        return wrapped
+
+    def close(self):
+        for session in self._sessions:
+            self.run(session.aclose())
+        self._sessions = []
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+
+    def _probe(self, delay):
+        self.run(self._asyncio.sleep(delay))
+
+
+class AiohttpSession(object):
+    """
+    The subset of the ``requests.Session`` interface used by the downloaders,
+    implemented on top of aiohttp. Cookies and headers are copied from the
+    given requests session.
+    """
+
+    def __init__(self, backend, session, pool_size):
+        self._backend = backend
+        self._pool_size = pool_size
+        self._session = None
+        self.cookies = session.cookies
+        self.headers = session.headers
+
+    async def _get_session(self):
+        if self._session is None:
+            import aiohttp
+
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self._pool_size),
+                cookies={c.name: c.value for c in self.cookies},
+                headers=dict(self.headers),
+            )
+        return self._session
+
+    async def _get(self, url, headers, timeout, stream):
+        import aiohttp
+
+        session = await self._get_session()
+        response = await session.get(
+            url,
+            headers=headers,
+            timeout=aiohttp.ClientTimeout(
+                total=None if stream else timeout, sock_read=timeout
+            ),
+        )
+        body = None
+        if not stream:
+            try:
+                body = await response.read()
+            finally:
+                response.release()
+        return response, body
+
+    def get(self, url, headers=None, timeout=None, stream=False, **kwargs):
+        response, body = self._backend.run(self._get(url, headers, timeout, stream))
+        return AiohttpResponse(self._backend, response, body)
+
+    def head(self, url, headers=None, timeout=None, **kwargs):
+        return self._backend.run(self._head(url, headers, timeout))
+
+    async def _head(self, url, headers, timeout):
+        import aiohttp
+
+        session = await self._get_session()
+        response = await session.head(
+            url, headers=headers, timeout=aiohttp.ClientTimeout(total=timeout)
+        )
+        response.release()
+        return AiohttpResponse(self._backend, response, b"")
+
+    async def aclose(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+
+class AiohttpResponse(object):
+    """The subset of ``requests.Response`` used by the downloaders."""
+
+    def __init__(self, backend, response, body):
+        self._backend = backend
+        self._response = response
+        self._body = body
+        self.status_code = response.status
+        self.headers = response.headers
+        self.url = str(response.url)
+
+    @property
+    def ok(self):
+        return self.status_code < 400
+
+    @property
+    def content(self):
+        if self._body is None:
+            self._body = self._backend.run(self._response.read())
+        return self._body
+
+    @property
+    def text(self):
+        return self.content.decode()
+
+    def iter_content(self, chunk_size=1024):
+        if self._body is not None:
+            for i in range(0, len(self._body), chunk_size):
+                yield self._body[i : i + chunk_size]
+            return
+        try:
+            while True:
+                data = self._backend.run(self._response.content.read(chunk_size))
+                if not data:
+                    break
+                yield data
+        finally:
+            self.close()
+
+    def close(self):
+        self._response.release()
+
+
+def make_backend(name, pool_size, check=True):
+    """
+    Creates the backend called ``name``. With ``check``, a quick self-check
+    verifies that the backend really overlaps blocking calls, falling back to
+    the thread backend if it does not (e.g. gevent without monkey patching).
+    """
+    if name == "thread":
+        backend = ThreadBackend(pool_size)
+    elif name == "gevent":
+        backend = GeventBackend(pool_size)
+    elif name == "asyncio":
+        backend = AsyncioBackend(pool_size)
+    else:
+        raise ValueError(
+            "Unknown backend {!r}, choose from {}".format(name, ", ".join(BACKENDS))
+        )
+    if check and name not in _CHECKED:
+        _CHECKED[name] = backend.self_check()
+    if check and not _CHECKED[name]:
+        _LOGGER.warning(
+            "Backend %r does not overlap requests, falling back to threads.", name
+        )
+        backend.close()
+        backend = ThreadBackend(pool_size)
+    return backend
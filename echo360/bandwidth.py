@@ -0,0 +1,124 @@
+"""
+Process-wide bandwidth limiting.
+
+Every segment and file fetch draws from the same token bucket, whatever video
+or feed it belongs to, so the limit applies to the whole run. The limit can
+follow a time-of-day schedule such as::
+
+    09:00-17:00=20M,17:00-09:00=unlimited
+
+Rates are in bytes per second with an optional K/M/G suffix (powers of 1000).
+"""
+import datetime
+import re
+import threading
+import time
+
+from .utils import parse_size
+
+_RULE_RE = re.compile(r"^\s*(\d{1,2}):(\d{2})\s*-\s*(\d{1,2}):(\d{2})\s*=\s*(.+)$")
+
+
+def parse_rate(rate):
+    """'20M' -> 20000000 bytes/s; None/'0'/'unlimited' -> None (no limit)."""
+    if rate is None:
+        return None
+    if isinstance(rate, str) and rate.strip().lower() in (
+        "",
+        "none",
+        "unlimited",
+        "inf",
+    ):
+        return None
+    value = parse_size(rate)
+    return value if value > 0 else None
+
+
+def parse_schedule(schedule):
+    """
+    Parses "HH:MM-HH:MM=RATE,..." into a list of (start, end, rate) with times
+    as minutes since midnight. A rule whose end is before its start wraps
+    around midnight.
+    """
+    rules = []
+    for rule in re.split(r"[,;]", schedule):
+        if not rule.strip():
+            continue
+        match = _RULE_RE.match(rule)
+        if match is None:
+            raise ValueError(
+                "Invalid bandwidth schedule rule {!r} "
+                "(e.g. 09:00-17:00=20M)".format(rule)
+            )
+        h1, m1, h2, m2 = (int(g) for g in match.groups()[:4])
+        rules.append((h1 * 60 + m1, h2 * 60 + m2, parse_rate(match.group(5))))
+    return rules
+
+
+class TokenBucket(object):
+    """
+    Thread-safe token bucket limiting throughput to ``rate`` bytes/s.
+
+    ``consume`` reserves the tokens under a short lock and then sleeps off any
+    deficit *outside* of it, so concurrent workers are never serialised: each
+    one waits for its own share while the others keep downloading.
+    """
+
+    def __init__(self, rate=None, schedule=None, burst_seconds=1.0):
+        self._lock = threading.Lock()
+        self._burst_seconds = burst_seconds
+        self._tokens = 0.0
+        self._last = time.monotonic()
+        self.configure(rate, schedule)
+
+    def configure(self, rate=None, schedule=None):
+        with self._lock:
+            self._default_rate = parse_rate(rate)
+            self._schedule = parse_schedule(schedule) if schedule else []
+            self._tokens = 0.0
+            self._last = time.monotonic()
+
+    def current_rate(self, now=None):
+        if self._schedule:
+            now = now or datetime.datetime.now()
+            minute = now.hour * 60 + now.minute
+            for start, end, rate in self._schedule:
+                if start <= end:
+                    inside = start <= minute < end
+                else:
+                    inside = minute >= start or minute < end
+                if inside:
+                    return rate
+        return self._default_rate
+
+    @property
+    def enabled(self):
+        return self._default_rate is not None or bool(self._schedule)
+
+    def consume(self, nbytes):
+        if not self.enabled:
+            return
+        rate = self.current_rate()
+        if rate is None:
+            return
+        with self._lock:
+            now = time.monotonic()
+            burst = rate * self._burst_seconds
+            self._tokens = min(burst, self._tokens + (now - self._last) * rate)
+            self._last = now
+            self._tokens -= nbytes
+            wait = -self._tokens / rate if self._tokens < 0 else 0
+        if wait > 0:
+            time.sleep(wait)
+
+
+_GLOBAL_LIMITER = TokenBucket()
+
+
+def get_limiter():
+    return _GLOBAL_LIMITER
+
+
+def configure(rate=None, schedule=None):
+    """Sets the process-wide limit, e.g. ``configure("20M")``."""
+    _GLOBAL_LIMITER.configure(rate, schedule)
@@ -0,0 +1,142 @@
+import logging
+import threading
+import time
+
+_LOGGER = logging.getLogger(__name__)
+
+DEFAULT_MIN_CONCURRENCY = 2
+DEFAULT_MAX_CONCURRENCY = 50
+
+
+class AIMDController(object):
+    """
+    Adjusts the number of in-flight segment requests at runtime, within
+    ``[floor, ceiling]``.
+
+    Requests are grouped into windows of ``limit`` completions. At the end of
+    each window the limit is raised if the throughput went up compared to the
+    previous window: doubled during the initial slow start, then by
+    ``increase``. Timeouts, connection errors, 429/5xx responses and latency
+    spikes (``latency_factor`` times the usual latency) cut the limit by
+    ``decrease`` instead, at most once per window, and end the slow start.
+
+    Workers call ``acquire`` before sending a request and ``release`` with its
+    outcome afterwards. A single controller may be shared by several
+    downloaders to give them one concurrency budget.
+    """
+
+    def __init__(
+        self,
+        floor=DEFAULT_MIN_CONCURRENCY,
+        ceiling=DEFAULT_MAX_CONCURRENCY,
+        initial=None,
+        increase=1,
+        decrease=0.5,
+        latency_factor=3.0,
+        improvement=1.05,
+    ):
+        self.floor = max(1, min(floor, ceiling))
+        self.ceiling = max(self.floor, ceiling)
+        self.limit = float(min(self.ceiling, max(self.floor, initial or self.floor)))
+        self.increase = increase
+        self.decrease = decrease
+        self.latency_factor = latency_factor
+        self.improvement = improvement
+        self._inflight = 0
+        self._cond = threading.Condition()
+        self._slow_start = True
+        self._latency_ewma = None
+        self._best_throughput = None
+        self._backed_off = False
+        self._reset_window()
+
+    @property
+    def inflight(self):
+        return self._inflight
+
+    def acquire(self):
+        with self._cond:
+            while self._inflight >= int(self.limit):
+                self._cond.wait()
+            self._inflight += 1
+
+    def suspend(self):
+        """
+        Gives the slot of an in-flight request back while it waits for
+        something else (e.g. memory), without counting it as completed.
+        """
+        with self._cond:
+            self._inflight -= 1
+            self._cond.notify_all()
+
+    def resume(self):
+        """Takes a slot again after ``suspend``."""
+        self.acquire()
+
+    def release(self, nbytes=0, latency=None, error=None):
+        """
+        ``error`` is anything truthy for a request that failed in a way that
+        indicates overload (timeout, 429/5xx, ...).
+        """
+        with self._cond:
+            self._inflight -= 1
+            spike = (
+                latency is not None
+                and self._latency_ewma is not None
+                and latency > self.latency_factor * self._latency_ewma
+            )
+            if error or spike:
+                self._back_off("error: {}".format(error) if error else "latency spike")
+            else:
+                if latency is not None:
+                    self._latency_ewma = (
+                        latency
+                        if self._latency_ewma is None
+                        else 0.8 * self._latency_ewma + 0.2 * latency
+                    )
+            self._window_bytes += nbytes
+            self._window_done += 1
+            if self._window_done >= int(self.limit):
+                self._end_window()
+            self._cond.notify_all()
+
+    def _reset_window(self):
+        self._window_start = time.monotonic()
+        self._window_bytes = 0
+        self._window_done = 0
+        self._backed_off = False
+
+    def _end_window(self):
+        elapsed = max(time.monotonic() - self._window_start, 1e-6)
+        throughput = self._window_bytes / elapsed
+        if not self._backed_off:
+            if (
+                self._best_throughput is None
+                or throughput > self._best_throughput * self.improvement
+            ):
+                self._set_limit(
+                    self.limit * 2 if self._slow_start else self.limit + self.increase,
+                    "throughput rising ({:.0f} B/s)".format(throughput),
+                )
+            else:
+                # plateau, more connections don't help
+                self._slow_start = False
+        self._best_throughput = max(self._best_throughput or 0, throughput)
+        self._reset_window()
+
+    def _back_off(self, reason):
+        if self._backed_off:
+            return
+        self._backed_off = True
+        self._slow_start = False
+        # forget the old peak, the link (or origin) might have changed since
+        self._best_throughput = None
+        self._set_limit(self.limit * self.decrease, reason)
+
+    def _set_limit(self, limit, reason):
+        limit = min(self.ceiling, max(self.floor, limit))
+        if int(limit) != int(self.limit):
+            _LOGGER.debug(
+                "Concurrency %d -> %d (%s)", int(self.limit), int(limit), reason
+            )
+        self.limit = limit
@@ -8,6 +8,7 @@ import requests
 import selenium
 import logging
 
+from .http_cache import get_http_cache
 from .videos import EchoVideos, EchoCloudVideos
 import selenium.common.exceptions
 import selenium.webdriver
@@ -19,6 +20,7 @@ _LOGGER = logging.getLogger(__name__)
 
 class EchoCourse:
     driver:WebDriver
+    session_manager = None
     def __init__(self, uuid, hostname=None, alternative_feeds=False):
         self._course_id:Optional[str] = None
         self._course_name:Optional[str] = None
@@ -107,6 +109,9 @@ class EchoCourse:
     def set_driver(self, driver):
         self.driver = driver
 
+    def set_session_manager(self, session_manager):
+        self.session_manager = session_manager
+
     def _blow_up(self, msg, e):
         print(msg)
         print(f"Exception: {str(e)}")
@@ -187,16 +192,21 @@ class EchoCloudCourse(EchoCourse):
                 self.driver.page_source,
             )
             # use requests to retrieve data
-            session = requests.Session()
-            # load cookies
-            for cookie in self.driver.get_cookies():
-                session.cookies.set(cookie["name"], cookie["value"])
-
-            r = session.get(self.video_url)
-            if not r.ok:
+            if self.session_manager is not None:
+                # we just navigated, so the login cookies may be new
+                self.session_manager.invalidate()
+                session = self.session_manager.session
+            else:
+                session = requests.Session()
+                # load cookies
+                for cookie in self.driver.get_cookies():
+                    session.cookies.set(cookie["name"], cookie["value"])
+
+            r, body = get_http_cache().get(session, self.video_url)
+            if body is None:
                 raise Exception("Error: Failed to get m3u8 info for EchoCourse!")
 
-            json_str = r.text
+            json_str = body.decode()
         except ValueError as e:
             raise Exception("Unable to retrieve JSON (course_data) from url", e)
         self.course_data = json.loads(json_str)
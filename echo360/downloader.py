@@ -8,8 +8,13 @@ import re
 
 from pathlib import Path
 
+from .concurrency import AIMDController
 from .course import EchoCloudCourse, EchoCourse
 from .echo_exceptions import EchoLoginError
+from .session_manager import SessionManager
+from .metrics import get_metrics
+from .scheduler import LectureScheduler
+from . import planner
 # from .utils import naive_versiontuple
 
 from selenium.webdriver.common.keys import Keys
@@ -79,6 +84,20 @@ class EchoDownloader(object):
         use_local_binary=False,
         webdriver_to_use="chrome",
         interactive_mode=False,
+        backend="thread",
+        min_concurrency=2,
+        max_concurrency=50,
+        segment_cache=None,
+        retry_policy=None,
+        failure_budget=None,
+        chunk_size="256K",
+        stream_to_ffmpeg=False,
+        mux_mode="auto",
+        parallel_lectures=1,
+        plan=False,
+        disk_space_check="off",
+        variant_policy=None,
+        coalesce_bytes="8M",
     ):
         self._course = course
         base = Path(__file__).parent
@@ -89,6 +108,23 @@ class EchoDownloader(object):
         self._username = username
         self._password = password
         self.interactive_mode = interactive_mode
+        # extra options handed to every video's download()
+        self._download_kwargs = {
+            "backend": backend,
+            "pool_size": max_concurrency,
+            "min_pool_size": min_concurrency,
+            "segment_cache": segment_cache,
+            "retry_policy": retry_policy,
+            "failure_budget": failure_budget,
+            "chunk_size": chunk_size,
+            "stream_to_ffmpeg": stream_to_ffmpeg,
+            "mux_mode": mux_mode,
+            "variant_policy": variant_policy,
+            "coalesce_bytes": coalesce_bytes,
+        }
+        self._parallel_lectures = parallel_lectures
+        self._plan = plan
+        self._disk_space_check = disk_space_check
 
         self.regex_replace_invalid = re.compile(r"[\\\\/:*?\"<>|]")
 
@@ -112,6 +148,12 @@ class EchoDownloader(object):
         self.setup_credential = setup_credential
         # Monkey Patch, set the course's driver to the one from .downloader
         self._course.set_driver(self._driver)
+        # a single http session (and connection pool) for the whole run
+        self._session_manager = SessionManager(
+            self._driver, pool_maxsize=max_concurrency
+        )
+        self._course.set_session_manager(self._session_manager)
+        self._download_kwargs["session_manager"] = self._session_manager
         self._videos = []
 
     def login(self):
@@ -214,7 +256,9 @@ class EchoDownloader(object):
             self.login()
         sys.stdout.write(">> Retrieving echo360 Course Info... ")
         sys.stdout.flush()
-        videos = self._course.videos.videos
+        metrics = get_metrics()
+        with metrics.timer("scrape"):
+            videos = self._course.videos.videos
         print("Done!")
         # change the output directory to be inside a folder named after the course
         self._output_dir = os.path.join(
@@ -261,19 +305,101 @@ class EchoDownloader(object):
         )
         print("=" * 60)
 
-        downloaded_videos = []
-        for filename, video in videos_to_be_download:
-            if video.url is False:
-                print(
-                    f">> Skipping Lecture '{filename}' as it says it does "
-                    "not contain any video."
-                )
-            else:
-                if video.download(self._output_dir, filename):
-                    downloaded_videos.insert(0, filename)
+        # only the selected lectures are looked up, with one page load each
+        print(">> Locating the video of the selected lecture(s)...")
+        jobs = []
+        with metrics.timer("scrape"):
+            for filename, video in videos_to_be_download:
+                try:
+                    url = video.url
+                except Exception as e:
+                    _LOGGER.debug("Failed to locate the video of %s: %r", filename, e)
+                    print(
+                        f">> Skipping Lecture '{filename}' as its video could not "
+                        f"be found ({e})."
+                    )
+                    continue
+                if url is False:
+                    print(
+                        f">> Skipping Lecture '{filename}' as it says it does "
+                        "not contain any video."
+                    )
+                else:
+                    jobs.append((filename, video))
+        # logging in and scraping happened since, pick up the latest cookies
+        self._session_manager.invalidate()
+        durations = None
+        if self._plan or self._disk_space_check != "off":
+            jobs, plans = self._preflight(jobs)
+            if plans is None:
+                metrics.stop()
+                self._driver.close()
+                return
+            durations = [p.duration for p in plans]
+        download_kwargs = dict(self._download_kwargs)
+        if self._parallel_lectures > 1:
+            # concurrent lectures share one segment concurrency budget
+            download_kwargs["controller"] = AIMDController(
+                floor=download_kwargs["min_pool_size"],
+                ceiling=download_kwargs["pool_size"],
+            )
+
+        def download(filename, video):
+            ok = video.download(self._output_dir, filename, **download_kwargs)
+            metrics.videos.inc(result="ok" if ok else "failed")
+            return ok
+
+        scheduler = LectureScheduler(
+            self._parallel_lectures, self._session_manager.session
+        )
+        results = scheduler.run(jobs, download, durations)
+        downloaded_videos = [
+            filename for (filename, _), ok in zip(jobs, results) if ok
+        ][::-1]
+        # final write, so the file reflects the finished run
+        metrics.stop()
         print(self.success_msg(self._course.course_name, downloaded_videos))
         self._driver.close()
 
+    def _preflight(self, jobs):
+        """
+        Estimates the download of ``jobs`` and checks it against the free disk
+        space. Returns the jobs to download and their plans, the plans are
+        None when nothing should be downloaded.
+        """
+        sys.stdout.write(">> Estimating download size... ")
+        sys.stdout.flush()
+        plans = planner.Planner(
+            self._session_manager.session, self._download_kwargs["variant_policy"]
+        ).plan(jobs)
+        print("Done!")
+        free = planner.free_space(self._output_dir)
+        print(planner.report(plans, free))
+        if self._plan:
+            print(">> Plan only, nothing was downloaded.")
+            return jobs, None
+        unknown = planner.unknown(plans)
+        if unknown:
+            # never count what we couldn't size as free
+            print(
+                f">> WARNING: the size of {len(unknown)} lecture(s) is unknown, "
+                "there may not be enough free space for them!"
+            )
+        elif planner.required_space(plans) <= free:
+            return jobs, plans
+        if self._disk_space_check == "trim":
+            plans = planner.trim(plans, free)
+            print(
+                f">> Downloading only the first {len(plans)} of {len(jobs)} "
+                "lectures, the ones known to fit."
+            )
+            return jobs[: len(plans)], plans
+        if unknown:
+            print(">> Can't check the free space for these lectures, not downloading.")
+        else:
+            print(">> Not enough free space for these lectures, not downloading.")
+        return jobs, None
+
     @property
     def useragent(self):
         return self._useragent
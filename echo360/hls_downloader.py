@@ -1,63 +1,132 @@
 import ffmpy
-import gevent
-from gevent.pool import Pool
 import requests
-import os, sys
+import os
 import time
-import tqdm
 
+from . import m3u8
 from .echo_exceptions import HlsDownloaderError
+from .segment_assembler import SegmentAssembler, DEFAULT_WINDOW_BYTES
+from .segment_journal import SegmentJournal
+from .backends import make_backend, DEFAULT_BACKEND
+from .concurrency import AIMDController, DEFAULT_MIN_CONCURRENCY
+from .ranged_downloader import RangedDownloader
+from .bandwidth import get_limiter
+from .metrics import get_metrics
+from .progress import get_progress
+from .streaming import DEFAULT_CHUNK_SIZE, get_buffer_pool, read_body
+from .memory_budget import get_memory_budget
+from .http_cache import get_http_cache
+from .remux import FFmpegPipe, ffmpeg_available
+from .variant_policy import VariantPolicy
+from .utils import parse_size
+from .retry import (
+    RetryPolicy,
+    FailureBudget,
+    CircuitBreaker,
+    DEFAULT_FAILURE_BUDGET,
+    OVERLOAD_STATUS,
+    connection_retries,
+    is_fatal_error,
+    is_transient_error,
+    parse_retry_after,
+)
 import requests.adapters
+import logging
 
+_LOGGER = logging.getLogger(__name__)
 
-def urljoin(a, b):
-    # get url relative root path
-    a = a[: a.rfind("/") + 1]
-    # remove slashes at beginning if needed
-    while b[0] == "/":
-        b = b[1:]
-    return a + b
-
-
-# update_progress() : Displays or updates a console progress bar
-## Accepts a float between 0 and 1. Any int will be converted to a float.
-## A value under 0 represents a 'halt'.
-## A value at 1 or bigger represents 100%
-def update_progress(current, total, title=None):
-    if title is None:
-        title = "Progress"
-    barLength = 20  # Modify this to change the length of the progress bar
-    status = " {}/{}".format(current, total)
-    progress = float(current) / float(total)
-    if progress < 0:
-        progress = 0
-        status = "Halt...\r\n"
-    if progress >= 1:
-        progress = 1
-        status += " Done!\r\n"
-    block = "=" * int(round(barLength * progress))
-    if len(block) < barLength:
-        block += ">"
-    text = "\r{0}: [{1}] {2:.2f}% {3}".format(
-        title, block + " " * (barLength - len(block)), progress * 100, status
-    )
-    sys.stdout.write(text)
-    sys.stdout.flush()
+# cap on byte ranges merged into one request
+DEFAULT_COALESCE_BYTES = 8 * 1000 ** 2
+
+
+def _range_key(byterange):
+    if byterange is None:
+        return None
+    return "{}-{}".format(byterange.offset, byterange.end)
+
+
+def coalesce_byteranges(parts, max_bytes=DEFAULT_COALESCE_BYTES):
+    """
+    Merges consecutive ``(url, byterange)`` parts that are adjacent ranges of
+    the same resource into single ranges of at most ``max_bytes``, so a
+    playlist of small ranges into a few large files is fetched with a handful
+    of large sequential reads. Parts without a range are kept as they are.
+    """
+    merged = []
+    for url, byterange in parts:
+        if merged and byterange is not None:
+            last_url, last = merged[-1]
+            if (
+                last is not None
+                and last_url == url
+                and last.offset + last.length == byterange.offset
+                and last.length + byterange.length <= max_bytes
+            ):
+                length = last.length + byterange.length
+                merged[-1] = (url, m3u8.ByteRange(length, last.offset))
+                continue
+        merged.append((url, byterange))
+    return merged
 
 
 class Downloader:
     _result_file_name:str
 
-    def __init__(self, pool_size, retry=3, selenium_cookies=None):
-        self.pool = Pool(pool_size)
-        self.session = self._get_http_session(
-            pool_size, pool_size, retry, selenium_cookies
-        )
+    def __init__(
+        self,
+        pool_size,
+        retry=3,
+        selenium_cookies=None,
+        window_bytes=DEFAULT_WINDOW_BYTES,
+        backend=DEFAULT_BACKEND,
+        min_pool_size=DEFAULT_MIN_CONCURRENCY,
+        controller=None,
+        session_manager=None,
+        segment_cache=None,
+        retry_policy=None,
+        failure_budget=None,
+        chunk_size=DEFAULT_CHUNK_SIZE,
+        memory_budget=None,
+        stream_to_ffmpeg=False,
+        variant_policy=None,
+        coalesce_bytes=DEFAULT_COALESCE_BYTES,
+    ):
+        # pool_size is the ceiling, the number of requests actually in flight
+        # is adapted at runtime by the controller.
+        if controller is None:
+            controller = AIMDController(floor=min_pool_size, ceiling=pool_size)
+        self.controller = controller
+        self.backend = make_backend(backend, pool_size)
+        if session_manager is not None:
+            # the run-wide session, with its already warm connections
+            session = session_manager.session
+        else:
+            session = self._get_http_session(
+                pool_size, pool_size, retry, selenium_cookies
+            )
+        self.session = self.backend.wrap_session(session)
         self.retry = retry
+        self.window_bytes = window_bytes
+        self.chunk_size = chunk_size
+        # segments read but not yet written count towards this
+        self.memory_budget = memory_budget or get_memory_budget()
+        # remux while downloading, instead of converting the file afterwards
+        self.stream_to_ffmpeg = stream_to_ffmpeg
+        self.variant_policy = variant_policy or VariantPolicy()
+        self.coalesce_bytes = int(parse_size(coalesce_bytes))
+        self.segment_cache = segment_cache
+        self.retry_policy = retry_policy or RetryPolicy()
+        # failed attempts this lecture may retry in total, see _new_budget
+        self.failure_budget = failure_budget
+        self._budget = None
         self.dir = ""
-        self.succed = {}
-        self.failed = []
         self.ts_total = 0
+        self._name = None
+        self._progress = None
+        self._assembler = None
+        self._journal = None
+        self._m3u8_url = None
+        self._result_file_name = None
 
     def _get_http_session(
         self, pool_connections, pool_maxsize, max_retries, selenium_cookies=None
@@ -66,7 +135,7 @@ class Downloader:
         adapter = requests.adapters.HTTPAdapter(
             pool_connections=pool_connections,
             pool_maxsize=pool_maxsize,
-            max_retries=max_retries,
+            max_retries=connection_retries(max_retries),
         )
         session.mount("http://", adapter)
         session.mount("https://", adapter)
@@ -76,179 +145,459 @@ class Downloader:
                 session.cookies.set(cookie["name"], cookie["value"])
         return session
 
-    def run(self, m3u8_url, dir="", convert_to_mp4=True):
+    def run(self, m3u8_url, dir="", convert_to_mp4=True, name=None):
+        """
+        Downloads all segments of ``m3u8_url`` into ``dir``. ``name`` is the
+        base name of the intermediate file; giving a stable name per target
+        lets an interrupted download be resumed by the next run.
+
+        Raises HlsDownloaderError if the lecture had to be given up on.
+        """
+        try:
+            self._run(m3u8_url, dir, convert_to_mp4, name)
+        finally:
+            self.backend.close()
+
+    def _run(self, m3u8_url, dir, convert_to_mp4, name):
+        self._m3u8_url = m3u8_url
         self.dir = dir
         if self.dir and not os.path.isdir(self.dir):
             os.makedirs(self.dir)
-        r = self.session.get(m3u8_url, timeout=10)
-        if r.ok:
-            body = r.content
-            if body:
-                # use set to prevent duplicates
-                ts_list = {
-                    urljoin(m3u8_url, n.strip())
-                    for n in body.decode().split("\n")
-                    if n and not n.startswith("#")
-                }
-                ts_list = list(ts_list)
-                # this is very hacky as well.. But idk how to overcome some m3u8 has nested
-                # m3u8 and some don't.
-                if len(ts_list) == 1 and ts_list[0].split(".")[-1] not in (
-                    "ts",
-                    "mp4",
-                    "m4s",
-                ):
-                    file_name = ts_list[0].split("/")[-1].split("?")[0]
-                    chunk_list_url = "{0}/{1}".format(
-                        m3u8_url[: m3u8_url.rfind("/")], file_name
-                    )
-                    r = self.session.get(chunk_list_url, timeout=20)
-                    if r.ok:
-                        body = r.content
-                        ts_list = [
-                            urljoin(m3u8_url, n.strip())
-                            for n in body.decode().split("\n")
-                            if n and not n.startswith("#")
-                        ]
-                    # re-retrieve to get all ts file list
-
-                ts_list = zip(ts_list, [n for n in range(len(ts_list))])
-                ts_list = list(ts_list)
-
-                if ts_list:
-                    self.ts_total = len(ts_list)
-                    self.ts_current = 0
-                    g1 = gevent.spawn(self._join_file)
-                    self._download(ts_list)
-                    g1.join()
-        else:
-            print("Failed status code: {}".format(r.status_code))
-        infile_name = os.path.join(
-            self.dir,
-            self._result_file_name.split(".")[0]
-            + "_all."
-            + self.result_file_name.split(".")[-1],
+        # the playlists are retried like segments, from a small budget
+        self._budget = FailureBudget(self.retry_policy.max_attempts)
+        playlist = self._get_media_playlist(m3u8_url)
+        if playlist.encrypted:
+            raise HlsDownloaderError(
+                "{} is encrypted (EXT-X-KEY), which isn't supported".format(m3u8_url)
+            )
+        # fragmented MP4 segments are preceded by their init section
+        parts = []
+        init_section = None
+        for segment in playlist.segments:
+            if segment.init_section not in (None, init_section):
+                init_section = segment.init_section
+                parts.append((init_section.uri, init_section.byterange))
+            parts.append((segment.uri, segment.byterange))
+        # de-duplicate while preserving the playlist order
+        seen = set()
+        unique = []
+        for url, byterange in parts:
+            key = (url, _range_key(byterange))
+            if key not in seen:
+                seen.add(key)
+                unique.append((url, byterange))
+        parts = coalesce_byteranges(unique, self.coalesce_bytes)
+        # (url, index, byte range or None)
+        ts_list = [(url, i, byterange) for i, (url, byterange) in enumerate(parts)]
+        if not ts_list:
+            raise HlsDownloaderError("No segments found in {}".format(m3u8_url))
+
+        self.ts_total = len(ts_list)
+        self._budget = FailureBudget(
+            self.failure_budget
+            or max(DEFAULT_FAILURE_BUDGET, self.ts_total // 10)
+        )
+        file_name = ts_list[0][0].split("/")[-1].split("?")[0]
+        self._name = name or file_name.split(".")[0]
+        self._result_file_name = os.path.join(
+            self.dir, self._name + "_all." + file_name.split(".")[-1]
         )
-        self._result_file_name = infile_name
+        if convert_to_mp4 and self.stream_to_ffmpeg and len(ts_list) > 1:
+            if ffmpeg_available():
+                self._download_to_ffmpeg(ts_list, file_name.split(".")[-1])
+                return
+            get_progress().message(
+                '  > Not streaming {} into ffmpeg, because "ffmpeg" not '
+                "installed.".format(self._name)
+            )
+        with get_metrics().timer("download"):
+            self._download(ts_list)
+        infile_name = self._result_file_name
         if convert_to_mp4:
-            outfile_name = infile_name.split(".")[0] + ".mp4"
-            sys.stdout.write("  > Converting to mp4... ")
-            sys.stdout.flush()
+            outfile_name = os.path.splitext(infile_name)[0] + ".mp4"
+            # whole lines only, other downloads may be drawing progress below
+            progress = get_progress()
+            progress.message("  > Converting {} to mp4...".format(self._name))
             try:
                 ff = ffmpy.FFmpeg(
                     global_options="-loglevel panic",
                     inputs={infile_name: None},
                     outputs={outfile_name: ["-c", "copy"]},
                 )
-                ff.run()
+                with get_metrics().timer("ffmpeg"):
+                    ff.run()
                 # delete source file after done
                 os.remove(infile_name)
                 self._result_file_name = outfile_name
-                print("Done!")
+                progress.message("  > Converted {} to mp4.".format(self._name))
             except ffmpy.FFExecutableNotFoundError:
-                print('Skipping! Because "ffmpeg" not installed.')
+                progress.message(
+                    '  > Not converting {}, because "ffmpeg" not installed.'.format(
+                        self._name
+                    )
+                )
                 self._result_file_name = infile_name
             except ffmpy.FFRuntimeError:
-                print("Error! ffmpeg exited with non-zero status code.")
+                progress.message(
+                    "  > Error converting {}! ffmpeg exited with non-zero "
+                    "status code.".format(self._name)
+                )
                 self._result_file_name = infile_name
+        if self._journal is not None:
+            # the download is complete, nothing left to resume
+            self._journal.remove()
 
     def _download(self, ts_list):
-        if len(ts_list) == 1:
+        if len(ts_list) == 1 and ts_list[0][2] is None:
             self._worker_single(ts_list[0])
-        else:
-            self.pool.map(self._worker, ts_list)
-        if self.failed:
-            ts_list = self.failed
-            self.failed = []
-            self._download(ts_list)
+            return
+        self._journal = self._load_journal(ts_list)
+        start = self._journal.written
+        window = self._journal.take_window()
+        if start or window:
+            get_progress().message(
+                "  > Resuming, {} of {} segments already downloaded".format(
+                    start + len(window), self.ts_total
+                )
+            )
+        with open(self._result_file_name, "r+b" if start else "wb") as outfile:
+            # drop anything written after the last journal sync
+            outfile.truncate(self._journal.size)
+            outfile.seek(self._journal.size)
+            self._fetch_segments(ts_list, outfile, start, window, self._journal)
+
+    def _download_to_ffmpeg(self, ts_list, ext):
+        """
+        Feeds the segments, in order, straight into ffmpeg's stdin while the
+        download continues. There is no intermediate file and therefore
+        nothing to resume from: an interrupted download starts over.
+        """
+        outfile_name = os.path.splitext(self._result_file_name)[0] + ".mp4"
+        pipe = FFmpegPipe(outfile_name, input_format="mpegts" if ext == "ts" else None)
+        try:
+            with get_metrics().timer("download"):
+                self._fetch_segments(ts_list, pipe)
+        except BaseException:
+            pipe.abort()
+            raise
+        progress = get_progress()
+        progress.message("  > Finishing {}.mp4...".format(self._name))
+        with get_metrics().timer("ffmpeg"):
+            pipe.finish()
+        progress.message("  > Finished {}.mp4.".format(self._name))
+        self._result_file_name = outfile_name
+
+    def _fetch_segments(self, ts_list, outfile, start=0, window=None, journal=None):
+        """Downloads the segments of ``ts_list`` into ``outfile``, in order."""
+        window = window or {}
+        self._assembler = SegmentAssembler(
+            outfile,
+            self.ts_total,
+            window_bytes=self.window_bytes,
+            start=start,
+            window=window,
+            journal=journal,
+            budget=self.memory_budget,
+        )
+        ts_list = [t for t in ts_list if t[1] >= start and t[1] not in window]
+        self._progress = get_progress().task(
+            self._name, self.ts_total, initial=self.ts_total - len(ts_list)
+        )
+        try:
+            # each worker retries its own segment, a segment that is given
+            # up on fails the lecture (what we got is kept for resuming)
+            self.backend.map(self._worker, ts_list)
+        finally:
+            self._progress.close(ok=self._assembler.finished)
+            # keep the window of an interrupted run for the next one
+            self._assembler.close(
+                keep_window=not self._assembler.finished and journal is not None
+            )
+
+    def _load_journal(self, ts_list):
+        journal_path = self._result_file_name + ".journal"
+        # ranges of a resource are told apart by their offsets
+        segments = [
+            url if r is None else "{}#{}".format(url.split("?")[0], _range_key(r))
+            for url, _, r in ts_list
+        ]
+        journal = SegmentJournal.load(journal_path, self._m3u8_url, segments)
+        if journal.size and (
+            not os.path.isfile(self._result_file_name)
+            or os.path.getsize(self._result_file_name) < journal.size
+        ):
+            # output went missing (or got truncated), start over
+            _LOGGER.debug("Discarding journal %s, output is incomplete", journal_path)
+            journal = journal.discard()
+        return journal
 
     def _worker_single(self, ts_tuple):
         url = ts_tuple[0]
-        index = ts_tuple[1]
-        retry = self.retry
-        update_progress(
-            self.ts_current, self.ts_total, title="  > {}".format("Progress")
+        if self._single_cache_valid(url) and self.segment_cache.copy_to(
+            url, self._result_file_name
+        ):
+            return
+        # a single (large) file, fetch it as concurrent byte ranges. The parts
+        # retry (and resume from where they stopped) on their own.
+        ranged = RangedDownloader(
+            self.session, retry_policy=self.retry_policy, chunk_size=self.chunk_size
         )
-        while retry:
-            try:
-                r = self.session.get(url, stream=True, timeout=20)
-                total_size = int(r.headers.get("content-length", 0))
-                block_size = 1024  # 1 kilobyte
-                file_name = url.split("/")[-1].split("?")[0]
-                result_full_path = os.path.join(self.dir, file_name)
-                with tqdm.tqdm(total=total_size, unit="iB", unit_scale=True) as pbar:
-                    with open(result_full_path, "wb") as f:
-                        for data in r.iter_content(block_size):
-                            pbar.update(len(data))
-                            f.write(data)
-                self.succed[index] = file_name
-                self.ts_current += 1
-                return
-            except EnvironmentError as e:
-                print("\r\nError in writing file: {}".format(e))
-                raise HlsDownloaderError
-            except:
-                retry -= 1
-        sys.stdout.write("[FAIL]")
-        self.failed.append((url, index))
+        try:
+            ranged.download(url, self._result_file_name, name=self._name)
+        except (requests.RequestException, EnvironmentError) as e:
+            if is_fatal_error(e):
+                raise HlsDownloaderError("Error in writing file: {}".format(e))
+            r = getattr(e, "response", None)
+            reason = e if r is None else "status code {}".format(r.status_code)
+            raise HlsDownloaderError("Failed to download {}: {}".format(url, reason))
+        if self.segment_cache is not None:
+            self.segment_cache.put_file(url, self._result_file_name, ranged.etag)
+
+    def _single_cache_valid(self, url):
+        """Whether a cached copy of the single file ``url`` may be used."""
+        if self.segment_cache is None:
+            return False
+        data_path, etag = self.segment_cache.lookup(url)
+        if data_path is None or not self.segment_cache.revalidate:
+            return data_path is not None
+        if etag is None:
+            return False
+        # a 1 byte conditional GET, as signed urls may reject HEAD
+        try:
+            r = self.session.get(
+                url,
+                headers={"If-None-Match": etag, "Range": "bytes=0-0"},
+                stream=True,
+                timeout=20,
+            )
+        except requests.RequestException as e:
+            _LOGGER.debug("Failed to revalidate %s: %s", url, e)
+            return False
+        r.close()
+        return r.status_code == 304
 
     def _worker(self, ts_tuple):
-        url = ts_tuple[0]
-        index = ts_tuple[1]
-        retry = self.retry
-        update_progress(
-            self.ts_current, self.ts_total, title="  > {}".format("Progress")
-        )
-        while retry:
+        if self._assembler.aborted:
+            # another segment failed the lecture, don't fetch the rest
+            return
+        try:
+            self._fetch_segment(*ts_tuple)
+        except BaseException:
+            # release the workers waiting for the head to advance
+            self._assembler.abort()
+            raise
+
+    def _fetch_segment(self, url, index, byterange):
+        cached, etag = None, None
+        if self.segment_cache is not None and byterange is None:
+            # ranges aren't cached, how they are merged depends on the settings
+            cached, etag = self.segment_cache.get(url)
+
+        def is_next():
+            # the assembler is waiting for this one, never hold it back
+            return self._assembler.next_index >= index
+
+        if cached is not None and not self.segment_cache.revalidate:
+            body = cached
+        else:
+            body = self._with_retry(
+                url,
+                lambda: self._get_cached_segment(url, cached, etag, is_next, byterange),
+            )
+        if body is cached:
+            # downloaded bodies were reserved before reading them
+            self.memory_budget.acquire(len(body), is_next)
+        try:
+            # hand the segment over to be written in order, no temp file
+            self._assembler.add(index, body)
+        except EnvironmentError as e:
+            raise HlsDownloaderError("Error in writing file: {}".format(e))
+        # cached segments count as done, but not as downloaded
+        self._progress.update(1, len(body) if body is not cached else 0)
+
+    def _get_playlist(self, url):
+        def fetch():
+            return get_http_cache().get(self.session, url, timeout=10)
+
+        return self._with_retry(url, fetch)
+
+    def _get_media_playlist(self, url):
+        """
+        The media playlist at ``url``. A master playlist is followed to the
+        variant the policy selects, which is also how some servers nest the
+        media playlist.
+        """
+        for _ in range(2):
             try:
-                r = self.session.get(url, timeout=20)
-                if r.ok:
-                    file_name = url.split("/")[-1].split("?")[0]
-                    with open(os.path.join(self.dir, file_name), "wb") as f:
-                        f.write(r.content)
-                    self.succed[index] = file_name
-                    self.ts_current += 1
-                    update_progress(
-                        self.ts_current,
-                        self.ts_total,
-                        title="  > {}".format("Progress"),
-                    )
-                    return
-            except EnvironmentError as e:
-                print("\r\nError in writing file: {}".format(e))
-                raise HlsDownloaderError
-            except:
-                retry -= 1
-        sys.stdout.write("[FAIL]")
-        self.failed.append((url, index))
-
-    def _join_file(self):
-        index = 0
-        outfile = ""
-        while index < self.ts_total:
-            file_name = self.succed.get(index, "")
-            if file_name:
-                if self._result_file_name is None:
-                    self._result_file_name = file_name
-                infile = open(os.path.join(self.dir, file_name), "rb")
-                if not outfile:
-                    outfile = open(
-                        os.path.join(
-                            self.dir,
-                            file_name.split(".")[0]
-                            + "_all."
-                            + file_name.split(".")[-1],
-                        ),
-                        "wb",
+                playlist = m3u8.parse(self._get_playlist(url), url)
+            except m3u8.M3U8Error as e:
+                raise HlsDownloaderError("Invalid playlist {}: {}".format(url, e))
+            if isinstance(playlist, m3u8.MediaPlaylist):
+                return playlist
+            variant = self.variant_policy.select(playlist)
+            if variant is None:
+                raise HlsDownloaderError("No streams found in {}".format(url))
+            url = variant.uri
+        raise HlsDownloaderError("Playlists nested too deeply in {}".format(url))
+
+    def _with_retry(self, url, fetch):
+        """
+        Calls ``fetch`` until it succeeds and returns its result. ``fetch``
+        returns the response (or None) and the result. Failures are retried
+        with backoff as long as the retry policy and the lecture's failure
+        budget allow, and count towards the circuit breaker of the host when
+        they look like overload. Raises HlsDownloaderError when giving up.
+        """
+        breaker = CircuitBreaker.for_url(url)
+        attempt = 0
+        while True:
+            if self._budget.exhausted:
+                raise HlsDownloaderError(
+                    "Giving up, too many failed requests for this lecture"
+                )
+            breaker.wait()
+            r = error = status = None
+            try:
+                r, result = fetch()
+                if r is None or r.ok:
+                    breaker.record_success()
+                    return result
+            except Exception as e:
+                if is_fatal_error(e):
+                    raise HlsDownloaderError("Error in writing file: {}".format(e))
+                if getattr(e, "response", None) is not None:
+                    # an HTTPError, judge it by its status code
+                    r = e.response
+                elif not is_transient_error(e):
+                    raise
+                else:
+                    error = e
+            if error is None:
+                status = r.status_code
+            attempt += 1
+            headers = r.headers if r is not None else None
+            if error is not None or status in OVERLOAD_STATUS:
+                breaker.record_failure(
+                    parse_retry_after(headers.get("retry-after")) if headers else None
+                )
+            reason = error or "status code {}".format(status)
+            if not self.retry_policy.should_retry(attempt, status, error):
+                get_metrics().failures.inc()
+                raise HlsDownloaderError(
+                    "Failed to download {} after {} attempt(s): {}".format(
+                        url, attempt, reason
                     )
-                outfile.write(infile.read())
-                infile.close()
-                os.remove(os.path.join(self.dir, file_name))
-                index += 1
+                )
+            if not self._budget.spend():
+                continue
+            get_metrics().retries.inc()
+            delay = self.retry_policy.delay(attempt, status, headers)
+            _LOGGER.debug(
+                "Retrying %s in %.1fs (attempt %d): %s", url, delay, attempt, reason
+            )
+            time.sleep(delay)
+
+    def _get_cached_segment(self, url, cached, etag, exempt=None, byterange=None):
+        """
+        Fetches a segment (or ``byterange`` of ``url``), revalidating the
+        cached copy (if any) by its ETag, and stores fresh downloads in the
+        segment cache.
+        """
+        headers = {"If-None-Match": etag} if cached is not None and etag else None
+        r, body = self._get_segment(
+            url, exempt, byterange, timeout=20, headers=headers
+        )
+        if r.status_code == 304 and cached is not None:
+            return r, cached
+        if r.ok and self.segment_cache is not None and byterange is None:
+            self.segment_cache.put(
+                url, body, r.headers.get("etag"), r.headers.get("content-length")
+            )
+        return r, body
+
+    def _get_segment(self, url, exempt=None, byterange=None, **kwargs):
+        """
+        ``session.get`` within the concurrency limit, reporting the outcome
+        back to the controller. Returns the response and its body (None for
+        unsuccessful responses), which is reserved in the memory budget;
+        ``exempt`` is passed on to ``MemoryBudget.acquire``. With a
+        ``byterange`` only that range is requested (and accepted).
+        """
+        if byterange is not None:
+            kwargs["headers"] = dict(
+                kwargs.get("headers") or {},
+                Range="bytes={}-{}".format(byterange.offset, byterange.end),
+            )
+        metrics = get_metrics()
+        self.controller.acquire()
+        metrics.inflight.inc()
+        start = time.monotonic()
+        waited = 0.0
+        body = None
+        error = None
+        try:
+            r = self.session.get(url, stream=True, **kwargs)
+            if r.status_code == 429 or r.status_code >= 500:
+                error = r.status_code
+            if r.ok and byterange is not None:
+                self._check_range(r, url, byterange)
+            if r.ok:
+                reserved = int(r.headers.get("content-length") or self.chunk_size)
+                if not self.memory_budget.try_acquire(reserved, exempt):
+                    # don't hold a slot while waiting, the head segment may
+                    # need it to get through and free up the budget
+                    wait_start = time.monotonic()
+                    self.controller.suspend()
+                    try:
+                        self.memory_budget.acquire(reserved, exempt)
+                    finally:
+                        self.controller.resume()
+                    waited = time.monotonic() - wait_start
+                try:
+                    # read the body here, throttled by the global bandwidth limit
+                    body = self._read_body(r)
+                except Exception:
+                    self.memory_budget.release(reserved)
+                    raise
+                self.memory_budget.resize(reserved, len(body))
+                metrics.segment_latency.observe(time.monotonic() - start - waited)
             else:
-                time.sleep(1)
-        if outfile:
-            outfile.close()
+                r.close()
+            return r, body
+        except Exception as e:
+            error = type(e).__name__
+            raise
+        finally:
+            metrics.inflight.dec()
+            self.controller.release(
+                len(body) if body else 0, time.monotonic() - start - waited, error
+            )
+
+    @staticmethod
+    def _check_range(r, url, byterange):
+        if r.status_code != 206:
+            r.close()
+            raise HlsDownloaderError(
+                "{} doesn't support byte ranges (status {})".format(url, r.status_code)
+            )
+        expected = "bytes {}-{}/".format(byterange.offset, byterange.end)
+        if not r.headers.get("content-range", expected).startswith(expected):
+            r.close()
+            raise IOError(
+                "Asked for {} of {}, got {}".format(
+                    expected, url, r.headers["content-range"]
+                )
+            )
+
+    def _read_body(self, r):
+        limiter = get_limiter()
+        downloaded = get_metrics().bytes_downloaded
+
+        def on_chunk(nbytes):
+            limiter.consume(nbytes)
+            downloaded.inc(nbytes)
+
+        return read_body(r, get_buffer_pool(self.chunk_size), on_chunk)
 
     @property
     def result_file_name(self):
@@ -0,0 +1,105 @@
+"""
+On-disk HTTP validation cache for small, rarely changing resources such as
+playlists and the course JSON.
+
+Responses are stored with their ETag and Last-Modified. The next request for
+the same url is made conditional (If-None-Match / If-Modified-Since), so an
+unchanged resource comes back as a 304 without a body and is served from
+disk. The request is always made: the cache saves the transfer, it never
+serves stale data. Disabled unless ``configure`` was given a directory.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+
+from .segment_cache import normalise_url
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class HttpCache(object):
+    def __init__(self, root=None):
+        self.configure(root)
+
+    def configure(self, root=None):
+        self.root = root
+        if root:
+            os.makedirs(root, exist_ok=True)
+
+    @property
+    def enabled(self):
+        return bool(self.root)
+
+    def get(self, session, url, **kwargs):
+        """
+        ``session.get(url)``, conditional if a copy is cached. Returns the
+        response and the body (the cached one for a 304), or None as the body
+        of an unsuccessful response.
+        """
+        cached = self._load(url) if self.enabled else None
+        if cached is not None:
+            body, meta = cached
+            headers = dict(kwargs.pop("headers", None) or {})
+            if meta.get("etag"):
+                headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"):
+                headers["If-Modified-Since"] = meta["last_modified"]
+            kwargs["headers"] = headers
+        r = session.get(url, **kwargs)
+        if r.status_code == 304 and cached is not None:
+            _LOGGER.debug("%s not modified, using the cached copy", url)
+            return r, cached[0]
+        if not r.ok:
+            return r, None
+        body = r.content
+        if self.enabled:
+            etag = r.headers.get("etag")
+            last_modified = r.headers.get("last-modified")
+            if etag or last_modified:
+                self._store(url, body, etag, last_modified)
+        return r, body
+
+    def _path(self, url):
+        key = hashlib.sha256(normalise_url(url).encode()).hexdigest()
+        return os.path.join(self.root, key[:2], key + ".http")
+
+    def _load(self, url):
+        # a line of JSON metadata followed by the body, in one file so the
+        # two are replaced together
+        try:
+            with open(self._path(url), "rb") as f:
+                meta = json.loads(f.readline())
+                body = f.read()
+        except (EnvironmentError, ValueError):
+            return None
+        if len(body) != meta.get("length"):
+            return None
+        return body, meta
+
+    def _store(self, url, body, etag, last_modified):
+        path = self._path(url)
+        meta = {"etag": etag, "last_modified": last_modified, "length": len(body)}
+        tmp_path = "{}.{}.tmp".format(path, threading.get_ident())
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(tmp_path, "wb") as f:
+                f.write(json.dumps(meta).encode() + b"\n")
+                f.write(body)
+            os.replace(tmp_path, path)
+        except EnvironmentError as e:
+            # a cache that can't be written only costs the next run a transfer
+            _LOGGER.debug("Failed to cache %s: %s", url, e)
+
+
+_GLOBAL_CACHE = HttpCache()
+
+
+def get_http_cache():
+    return _GLOBAL_CACHE
+
+
+def configure(root=None):
+    """Enables the process-wide cache in the directory ``root``."""
+    _GLOBAL_CACHE.configure(root)
@@ -0,0 +1,343 @@
+"""
+Parsing of HLS playlists (RFC 8216).
+
+``parse`` reads a playlist in a single pass and returns either a
+``MasterPlaylist`` (the variants and renditions of a lecture) or a
+``MediaPlaylist`` (its segments). Echo360 has served both of these master
+layouts over time::
+
+    #EXT-X-STREAM-INF:BANDWIDTH=102092,RESOLUTION=1280x756,CODECS="avc1.640029,mp4a.40.2",AUDIO="group_audio"
+    s1q1.m3u8
+    #EXT-X-MEDIA:TYPE=AUDIO,GROUP-ID="group_audio",NAME="audio_0",DEFAULT=YES,URI="s0q0.m3u8"
+
+and, per quality, an audio group of its own (``AUDIO="q1"``, ``GROUP-ID="q1"``).
+Some servers (the classic echo360 one) nest a media playlist in a master
+playlist with a single bare URI, which parses as a master playlist with one
+variant.
+
+Attribute lists are tokenised with one precompiled regex scanning the line
+once, so parsing stays linear in the size of the playlist.
+"""
+import re
+from urllib.parse import urljoin, urlparse, urlsplit, urlunsplit
+
+# NAME=value pairs of an attribute list, the value quoted or up to the next comma
+_ATTRIBUTE_RE = re.compile(r'([A-Z0-9-]+)=("[^"]*"|[^,]*)')
+_BYTERANGE_RE = re.compile(r"^\s*(\d+)(?:@(\d+))?\s*$")
+_RESOLUTION_RE = re.compile(r"^(\d+)x(\d+)$")
+
+
+def parse_attributes(text):
+    """``'A=1,B="x,y"'`` -> ``{"A": "1", "B": "x,y"}``."""
+    return {
+        name: value[1:-1] if value[:1] == '"' else value
+        for name, value in _ATTRIBUTE_RE.findall(text)
+    }
+
+
+class ByteRange(object):
+    """``length`` bytes of a resource, starting at ``offset``."""
+
+    def __init__(self, length, offset):
+        self.length = length
+        self.offset = offset
+
+    @property
+    def end(self):
+        """Offset of the last byte (inclusive, as in a Range header)."""
+        return self.offset + self.length - 1
+
+    def __repr__(self):
+        return "ByteRange({}@{})".format(self.length, self.offset)
+
+
+class Key(object):
+    """The EXT-X-KEY a segment is encrypted with (``method`` NONE if it isn't)."""
+
+    def __init__(self, method, uri=None, iv=None, attributes=None):
+        self.method = method
+        self.uri = uri
+        self.iv = iv
+        self.attributes = attributes or {}
+
+    @property
+    def encrypted(self):
+        return self.method != "NONE"
+
+
+class InitSection(object):
+    """The EXT-X-MAP of (fragmented MP4) segments, to be prepended to them."""
+
+    def __init__(self, uri, byterange=None):
+        self.uri = uri
+        self.byterange = byterange
+
+
+class Segment(object):
+    def __init__(
+        self,
+        uri,
+        duration,
+        title="",
+        byterange=None,
+        key=None,
+        init_section=None,
+        discontinuity=False,
+        sequence=0,
+    ):
+        self.uri = uri
+        self.duration = duration
+        self.title = title
+        self.byterange = byterange
+        self.key = key
+        self.init_section = init_section
+        # a discontinuity (e.g. of the encoding) precedes this segment
+        self.discontinuity = discontinuity
+        self.sequence = sequence
+
+
+class Variant(object):
+    """An EXT-X-STREAM-INF: one quality of the video, with its attributes."""
+
+    def __init__(self, uri, attributes):
+        self.uri = uri
+        self.attributes = attributes
+        self.bandwidth = int(attributes.get("BANDWIDTH", 0) or 0)
+        match = _RESOLUTION_RE.match(attributes.get("RESOLUTION", ""))
+        self.resolution = (int(match.group(1)), int(match.group(2))) if match else None
+        self.codecs = [
+            c.strip() for c in attributes.get("CODECS", "").split(",") if c.strip()
+        ]
+        self.audio = attributes.get("AUDIO")
+
+    @property
+    def has_video(self):
+        """False for audio-only variants, as old masters listed the audio."""
+        if self.resolution is not None or not self.codecs:
+            return True
+        return any(not c.startswith("mp4a") for c in self.codecs)
+
+    def __repr__(self):
+        return "Variant({!r}, {})".format(self.uri, self.attributes)
+
+
+class Rendition(object):
+    """An EXT-X-MEDIA: an alternative (e.g. audio) stream of a group."""
+
+    def __init__(self, attributes, base_url=None):
+        self.attributes = attributes
+        self.type = attributes.get("TYPE")
+        self.group_id = attributes.get("GROUP-ID")
+        self.name = attributes.get("NAME")
+        self.default = attributes.get("DEFAULT") == "YES"
+        uri = attributes.get("URI")
+        self.uri = _resolve(base_url, uri) if uri else None
+
+
+class MasterPlaylist(object):
+    def __init__(self, url=None):
+        self.url = url
+        self.variants = []
+        self.renditions = []
+
+    @property
+    def video_variants(self):
+        return [v for v in self.variants if v.has_video]
+
+    def default_variant(self):
+        """
+        The last video variant listed, for what all variants share (e.g. the
+        duration). Which one to download is up to a ``VariantPolicy``.
+        """
+        variants = self.video_variants or self.variants
+        return variants[-1] if variants else None
+
+    def audio_for(self, variant):
+        """
+        URI of the separate audio of ``variant``, or None if its audio is
+        muxed into the video (or it has none). The group's default rendition
+        is preferred; old playlists list the audio as an audio-only variant.
+        """
+        if variant.audio is None:
+            return None
+        renditions = [
+            r
+            for r in self.renditions
+            if r.type == "AUDIO" and r.group_id == variant.audio and r.uri
+        ]
+        if renditions:
+            return sorted(renditions, key=lambda r: not r.default)[0].uri
+        for other in self.variants:
+            if other.audio == variant.audio and not other.has_video:
+                return other.uri
+        return None
+
+
+class MediaPlaylist(object):
+    def __init__(self, url=None):
+        self.url = url
+        self.segments = []
+        self.target_duration = None
+        self.media_sequence = 0
+        self.endlist = False
+
+    @property
+    def duration(self):
+        return sum(s.duration for s in self.segments)
+
+    @property
+    def encrypted(self):
+        return any(s.key is not None and s.key.encrypted for s in self.segments)
+
+
+class M3U8Error(ValueError):
+    pass
+
+
+def _resolve(base_url, uri):
+    return urljoin(base_url, uri) if base_url else uri
+
+
+def _resolver(base_url):
+    """
+    ``_resolve`` against ``base_url``, with a fast path for the plain
+    relative paths segments usually have (urljoin dominates parsing otherwise).
+    """
+    if not base_url:
+        return lambda uri: uri
+    base = urlsplit(base_url)
+    path = base.path[: base.path.rfind("/") + 1] or "/"
+    directory = urlunsplit((base.scheme, base.netloc, path, "", ""))
+
+    def resolve(uri):
+        if uri[0] not in "/.?#" and ":" not in uri and "/." not in uri:
+            return directory + uri
+        return urljoin(base_url, uri)
+
+    return resolve
+
+
+def _parse_byterange(value, previous_end):
+    match = _BYTERANGE_RE.match(value)
+    if match is None:
+        raise M3U8Error("Invalid byte range {!r}".format(value))
+    length = int(match.group(1))
+    if match.group(2) is not None:
+        return ByteRange(length, int(match.group(2)))
+    if previous_end is None:
+        raise M3U8Error(
+            "Byte range {!r} without offset or previous range".format(value)
+        )
+    return ByteRange(length, previous_end)
+
+
+def parse(text, url=None):
+    """
+    Parses the playlist ``text`` fetched from ``url`` (against which the URIs
+    are resolved). Returns a ``MasterPlaylist`` or a ``MediaPlaylist``, raises
+    ``M3U8Error`` if it isn't a valid playlist.
+    """
+    if isinstance(text, bytes):
+        text = text.decode("utf-8-sig")
+    lines = text.splitlines()
+    if not lines or not lines[0].strip().lstrip("\ufeff").startswith("#EXTM3U"):
+        raise M3U8Error("Not an M3U8 playlist")
+
+    resolve = _resolver(url)
+    master = MasterPlaylist(url)
+    media = MediaPlaylist(url)
+    # state of the next segment (or variant) URI
+    duration = None
+    title = ""
+    byterange = None
+    discontinuity = False
+    stream_inf = None
+    key = None
+    init_section = None
+    # where the previous segment's range ended, for ranges without offset
+    last_range_end = None
+    sequence = 0
+
+    for line in lines[1:]:
+        line = line.strip()
+        if not line:
+            continue
+        if line[0] != "#":
+            uri = resolve(line)
+            if stream_inf is not None:
+                master.variants.append(Variant(uri, stream_inf))
+                stream_inf = None
+                continue
+            if duration is None and urlparse(uri).path.endswith((".m3u8", ".m3u")):
+                # a bare playlist URI: a playlist nested in a master playlist
+                master.variants.append(Variant(uri, {}))
+                continue
+            media.segments.append(
+                Segment(
+                    uri,
+                    duration or 0.0,
+                    title,
+                    byterange,
+                    key,
+                    init_section,
+                    discontinuity,
+                    media.media_sequence + sequence,
+                )
+            )
+            sequence += 1
+            duration = None
+            title = ""
+            byterange = None
+            discontinuity = False
+            continue
+        if not line.startswith("#EXT"):
+            continue  # a comment
+        tag, _, value = line.partition(":")
+        if tag == "#EXTINF":
+            length, _, title = value.partition(",")
+            try:
+                duration = float(length)
+            except ValueError:
+                raise M3U8Error("Invalid EXTINF duration {!r}".format(length))
+        elif tag == "#EXT-X-BYTERANGE":
+            byterange = _parse_byterange(value, last_range_end)
+            last_range_end = byterange.offset + byterange.length
+        elif tag == "#EXT-X-STREAM-INF":
+            stream_inf = parse_attributes(value)
+        elif tag == "#EXT-X-MEDIA":
+            master.renditions.append(Rendition(parse_attributes(value), url))
+        elif tag == "#EXT-X-KEY":
+            attributes = parse_attributes(value)
+            key_uri = attributes.get("URI")
+            key = Key(
+                attributes.get("METHOD", "NONE"),
+                _resolve(url, key_uri) if key_uri else None,
+                attributes.get("IV"),
+                attributes,
+            )
+        elif tag == "#EXT-X-MAP":
+            attributes = parse_attributes(value)
+            if "URI" not in attributes:
+                raise M3U8Error("EXT-X-MAP without URI")
+            map_range = None
+            if "BYTERANGE" in attributes:
+                map_range = _parse_byterange(attributes["BYTERANGE"], 0)
+            init_section = InitSection(_resolve(url, attributes["URI"]), map_range)
+        elif tag == "#EXT-X-DISCONTINUITY":
+            discontinuity = True
+        elif tag == "#EXT-X-TARGETDURATION":
+            try:
+                media.target_duration = float(value)
+            except ValueError:
+                raise M3U8Error("Invalid EXT-X-TARGETDURATION {!r}".format(value))
+        elif tag == "#EXT-X-MEDIA-SEQUENCE":
+            try:
+                media.media_sequence = int(value)
+            except ValueError:
+                raise M3U8Error("Invalid EXT-X-MEDIA-SEQUENCE {!r}".format(value))
+        elif tag == "#EXT-X-ENDLIST":
+            media.endlist = True
+
+    if master.variants or master.renditions:
+        return master
+    return media
@@ -1,6 +1,13 @@
+import sys
+
+# gevent has to monkey patch before requests (and ssl) are imported, also when
+# started through the installed console script
+from .backends import patch_gevent_if_requested
+
+patch_gevent_if_requested(sys.argv)
+
 import argparse
 import os
-import sys
 import re
 import logging
 import time
@@ -22,6 +29,15 @@ except ImportError as e:
     subprocess.check_call([sys.executable, "-m", "pip", "install", "windows-curses"])
 
 from .echo_exceptions import EchoLoginError
+from .backends import patch_gevent
+from . import bandwidth
+from . import metrics
+from . import memory_budget
+from . import http_cache
+from .segment_cache import SegmentCache
+from .retry import RetryPolicy
+from .remux import MUX_MODES
+from .variant_policy import VariantPolicy
 from .downloader import EchoDownloader
 from .course import EchoCourse, EchoCloudCourse
 
@@ -255,6 +271,32 @@ def main(
         manual:bool=False,
         alternative_feeds:bool=False,
         usingEcho360Cloud:bool=False,
+        backend:Literal["thread", "gevent", "asyncio"]="thread",
+        min_concurrency:int=2,
+        max_concurrency:int=50,
+        bandwidth_limit:Optional[str]=None,
+        bandwidth_schedule:Optional[str]=None,
+        segment_cache_dir:Optional[str]=None,
+        segment_cache_size:str="10G",
+        segment_cache_revalidate:bool=True,
+        max_attempts:int=5,
+        failure_budget:Optional[int]=None,
+        metrics_file:Optional[str]=None,
+        metrics_interval:float=15,
+        chunk_size:str="256K",
+        memory_limit:Optional[str]=None,
+        stream_to_ffmpeg:bool=False,
+        mux_mode:Literal["auto", "copy", "ac3"]="auto",
+        parallel_lectures:int=1,
+        plan:bool=False,
+        disk_space_check:Literal["off", "abort", "trim"]="off",
+        variant:Literal["highest", "lowest"]="highest",
+        max_resolution:Optional[str]=None,
+        min_bandwidth:Optional[str]=None,
+        max_bandwidth:Optional[str]=None,
+        codecs:Optional[str]=None,
+        coalesce_bytes:str="8M",
+        http_cache_dir:Optional[str]=None,
     ) :
     '''
     Main function to download the lectures from echo360
@@ -263,11 +305,57 @@ def main(
         for example: http://recordings.engineering.illinois.edu/ess/portal/section/115f3def-7371-4e98-b72f-6efe53771b2a)",  # noqa
     :param course_hostname: str: The hostname of the echo360 course page
     :param output_path: str: Path to the desired output directory. The output directory must exist. Otherwise the current directory is used.
+    :param backend: str: How segments are fetched concurrently: "thread" (default), "gevent" or "asyncio" (requires aiohttp).
+    :param min_concurrency: int: Floor of the number of segment requests in flight, which is adapted at runtime.
+    :param max_concurrency: int: Ceiling of the number of segment requests in flight (e.g. 16 for CDNs that throttle).
+    :param bandwidth_limit: str: Cap on the total download rate in bytes/s, shared by all downloads (e.g. 20M).
+    :param bandwidth_schedule: str: Time-of-day limits overriding bandwidth_limit, e.g. "09:00-17:00=20M,17:00-09:00=unlimited".
+    :param segment_cache_dir: str: Directory of an on-disk segment cache shared across runs (disabled when not given).
+    :param segment_cache_size: str: Size cap of the segment cache, least recently used segments are evicted (e.g. 10G).
+    :param segment_cache_revalidate: bool: Confirm cached segments with the origin (by ETag) before using them (default). With --nosegment_cache_revalidate no request is made, but a changed origin object of the same length is served stale.
+    :param max_attempts: int: Attempts per request before giving up on it (and its lecture), with exponential backoff in between.
+    :param failure_budget: int: Failed requests a lecture may retry in total before it is skipped (default: 10% of its segments, at least 20).
+    :param metrics_file: str: Periodically write download metrics in the Prometheus text format to this file (e.g. for node_exporter's textfile collector).
+    :param metrics_interval: float: Seconds between writes of metrics_file.
+    :param chunk_size: str: Size of the reusable buffers response bodies are streamed through (e.g. 256K, 1M).
+    :param memory_limit: str: Cap on downloaded data held in memory before it is written to disk, shared by all downloads (e.g. 256M).
+    :param stream_to_ffmpeg: bool: Remux to mp4 while downloading by piping the segments into ffmpeg, without an intermediate .ts file (such downloads can't be resumed).
+    :param mux_mode: str: How audio is muxed with separate video: "auto" copies it when mp4 can hold it as is and re-encodes otherwise, "copy" always copies and "ac3" always re-encodes (the former behaviour).
+    :param parallel_lectures: int: Lectures downloaded at once, longest first, sharing max_concurrency and bandwidth_limit.
+    :param plan: bool: Only estimate the size, segments and duration of the selected lectures and the disk space needed, without downloading.
+    :param disk_space_check: str: Estimate the download first and, when it doesn't fit on the output filesystem, "abort" or "trim" the selection to what fits ("off" skips the estimate).
+    :param variant: str: Which quality to download of those within the limits below: "highest" (default) or "lowest".
+    :param max_resolution: str: Cap on the video resolution, e.g. 720p (1080p costs about twice the bytes).
+    :param min_bandwidth: str: Only consider variants of at least this bitrate in bits/s as listed in the playlist, e.g. 800K.
+    :param max_bandwidth: str: Only consider variants of at most this bitrate in bits/s, e.g. 3M.
+    :param codecs: str: Only consider variants whose codecs start with these, comma separated (e.g. "avc1,mp4a" to skip HEVC); only the kinds named (video, audio) are constrained.
+    :param coalesce_bytes: str: Size cap of the requests adjacent byte ranges (EXT-X-BYTERANGE segments of one file) are merged into.
+    :param http_cache_dir: str: Directory to keep playlists and course data in, so later runs revalidate them (ETag / Last-Modified) instead of downloading them again (disabled when not given).
     '''
 
     output_path = Path(output)
     output_path.mkdir(parents=True, exist_ok=True)
     setup_logging(enable_degbug)
+    if backend == "gevent":
+        # the entry point normally did this already, before requests got imported
+        patch_gevent()
+    bandwidth.configure(bandwidth_limit, bandwidth_schedule)
+    metrics.configure(metrics_file, metrics_interval)
+    memory_budget.configure(memory_limit)
+    http_cache.configure(http_cache_dir)
+    if mux_mode not in MUX_MODES:
+        print("Error: mux_mode must be one of {}".format(", ".join(MUX_MODES)))
+        sys.exit(1)
+    if disk_space_check not in ("off", "abort", "trim"):
+        print("Error: disk_space_check must be one of off, abort, trim")
+        sys.exit(1)
+    try:
+        variant_policy = VariantPolicy(
+            variant, max_resolution, min_bandwidth, max_bandwidth, codecs
+        )
+    except ValueError as e:
+        print("Error: {}".format(e))
+        sys.exit(1)
 
     if not usingEcho360Cloud and any(
         token in course_hostname for token in ["echo360.org", "echo360.net"]
@@ -332,11 +420,6 @@ def main(
         ).group()  # retrieve the last part of the URL
         course = EchoCloudCourse(course_uuid, course_hostname, alternative_feeds)
     else:
-        # import it here for monkey patching gevent, to fix the followings:
-        # MonkeyPatchWarning: Monkey-patching ssl after ssl has already been
-        # imported may lead to errors, including RecursionError on Python 3.6.
-        from . import hls_downloader
-
         course_uuid = re.search(
             "[^/]+(?=/$|$)", course_url
         ).group()  # retrieve the last part of the URL
@@ -351,6 +434,28 @@ def main(
         # use_local_binary=use_local_binary,
         webdriver_to_use=webdriver_to_use,
         interactive_mode=interactive_mode,
+        backend=backend,
+        min_concurrency=min_concurrency,
+        max_concurrency=max_concurrency,
+        segment_cache=(
+            SegmentCache(
+                segment_cache_dir,
+                max_size=segment_cache_size,
+                revalidate=segment_cache_revalidate,
+            )
+            if segment_cache_dir
+            else None
+        ),
+        retry_policy=RetryPolicy(max_attempts=max_attempts),
+        failure_budget=failure_budget,
+        chunk_size=chunk_size,
+        stream_to_ffmpeg=stream_to_ffmpeg,
+        mux_mode=mux_mode,
+        parallel_lectures=parallel_lectures,
+        plan=plan,
+        disk_space_check=disk_space_check,
+        variant_policy=variant_policy,
+        coalesce_bytes=coalesce_bytes,
     )
 
     _LOGGER.debug(
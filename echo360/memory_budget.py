@@ -0,0 +1,97 @@
+"""
+Process-wide ceiling on downloaded data held in memory.
+
+A segment body is reserved before it is read and released once it is written
+to disk, so with many workers and high bitrate feeds the total
+stays below the budget instead of growing with the pool size. The segment an
+assembler is waiting for is exempt and workers give up their concurrency
+slot while they wait, so the head of a download always gets through.
+"""
+import logging
+import threading
+import time
+
+from .metrics import get_metrics
+from .utils import parse_size
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class MemoryBudget(object):
+    def __init__(self, limit=None):
+        self._cond = threading.Condition()
+        self.used = 0
+        self.configure(limit)
+
+    def configure(self, limit=None):
+        with self._cond:
+            self.limit = int(parse_size(limit)) if limit else None
+            self._cond.notify_all()
+
+    def acquire(self, nbytes, exempt=None):
+        """
+        Reserves ``nbytes``, waiting until they fit in the budget unless
+        ``exempt()`` becomes true (e.g. the segment is next in line). A single
+        reservation larger than the whole budget is let through alone.
+        Returns the seconds spent waiting.
+        """
+        start = time.monotonic()
+        with self._cond:
+            if self._must_wait(nbytes, exempt):
+                _LOGGER.debug(
+                    "Memory budget: %d/%d bytes buffered, waiting to read %d",
+                    self.used,
+                    self.limit,
+                    nbytes,
+                )
+                while self._must_wait(nbytes, exempt):
+                    # exempt() may change without a release, check regularly
+                    self._cond.wait(0.5)
+            self.used += nbytes
+        get_metrics().buffered_bytes.inc(nbytes)
+        return time.monotonic() - start
+
+    def try_acquire(self, nbytes, exempt=None):
+        """Reserves ``nbytes`` if that needs no waiting, returns whether it did."""
+        with self._cond:
+            if self._must_wait(nbytes, exempt):
+                return False
+            self.used += nbytes
+        get_metrics().buffered_bytes.inc(nbytes)
+        return True
+
+    def resize(self, reserved, actual):
+        """Corrects a reservation to the actual size, without waiting."""
+        if actual > reserved:
+            with self._cond:
+                self.used += actual - reserved
+            get_metrics().buffered_bytes.inc(actual - reserved)
+        else:
+            self.release(reserved - actual)
+
+    def release(self, nbytes):
+        if not nbytes:
+            return
+        with self._cond:
+            self.used -= nbytes
+            self._cond.notify_all()
+        get_metrics().buffered_bytes.dec(nbytes)
+
+    def _must_wait(self, nbytes, exempt):
+        if self.limit is None or self.used == 0:
+            return False
+        if self.used + nbytes <= self.limit:
+            return False
+        return not (exempt is not None and exempt())
+
+
+_GLOBAL_BUDGET = MemoryBudget()
+
+
+def get_memory_budget():
+    return _GLOBAL_BUDGET
+
+
+def configure(limit=None):
+    """Sets the process-wide budget, e.g. ``configure("256M")``."""
+    _GLOBAL_BUDGET.configure(limit)
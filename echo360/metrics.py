@@ -0,0 +1,247 @@
+"""
+Download metrics in the Prometheus text format.
+
+Metrics are collected process-wide and, once ``configure`` was given a path,
+periodically written to that file (atomically), e.g. into the directory of
+node_exporter's textfile collector::
+
+    --metrics_file /var/lib/node_exporter/textfile/echo360.prom
+
+Collecting is cheap and always on; nothing is written without a path.
+"""
+import contextlib
+import os
+import threading
+import time
+
+# seconds, from a fast CDN hit to a segment that barely made it
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+DEFAULT_INTERVAL = 15.0
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{{{}}}".format(
+        ",".join(
+            '{}="{}"'.format(k, str(v).replace("\\", "\\\\").replace('"', '\\"'))
+            for k, v in labels
+        )
+    )
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric(object):
+    kind = None
+
+    def __init__(self, name, help, labelled=False):
+        self.name = name
+        self.help = help
+        self._lock = threading.Lock()
+        # unlabelled metrics are reported (as 0) before their first update
+        self._values = {} if labelled else {(): 0}
+
+    def _key(self, labels):
+        return tuple(sorted(labels.items()))
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, key, value) for key, value in self._values.items()]
+
+    def render(self):
+        lines = [
+            "# HELP {} {}".format(self.name, self.help),
+            "# TYPE {} {}".format(self.name, self.kind),
+        ]
+        for name, labels, value in self.samples():
+            lines.append(
+                "{}{} {}".format(name, _format_labels(labels), _format_value(value))
+            )
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, buckets=LATENCY_BUCKETS):
+        super(Histogram, self).__init__(name, help)
+        self.buckets = tuple(buckets) + (float("inf"),)
+        self._counts = [0] * len(self.buckets)
+        self._sum = 0.0
+
+    def observe(self, value):
+        with self._lock:
+            self._sum += value
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    self._counts[i] += 1
+                    break
+
+    def samples(self):
+        with self._lock:
+            counts, total = list(self._counts), self._sum
+        samples = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, counts):
+            cumulative += count
+            samples.append(
+                (self.name + "_bucket", (("le", _format_value(bound)),), cumulative)
+            )
+        samples.append((self.name + "_sum", (), total))
+        samples.append((self.name + "_count", (), cumulative))
+        return samples
+
+
+class Metrics(object):
+    """The downloader's metrics, plus the optional periodic file writer."""
+
+    def __init__(self):
+        self.bytes_downloaded = Counter(
+            "echo360_downloaded_bytes_total", "Bytes downloaded (segments and files)."
+        )
+        self.download_rate = Gauge(
+            "echo360_download_bytes_per_second",
+            "Download rate since the previous metrics write.",
+        )
+        self.segment_latency = Histogram(
+            "echo360_segment_latency_seconds",
+            "Time to fetch one segment, from request to its last byte.",
+        )
+        self.retries = Counter(
+            "echo360_request_retries_total", "Failed requests that were retried."
+        )
+        self.failures = Counter(
+            "echo360_request_failures_total", "Requests that were given up on."
+        )
+        self.inflight = Gauge(
+            "echo360_inflight_requests", "Segment requests currently in flight."
+        )
+        self.buffered_bytes = Gauge(
+            "echo360_buffered_bytes",
+            "Downloaded bytes held in memory, not yet written to disk.",
+        )
+        self.videos = Counter(
+            "echo360_videos_total",
+            "Videos processed, by result (ok or failed).",
+            labelled=True,
+        )
+        self.phase_seconds = Counter(
+            "echo360_phase_seconds_total",
+            "Time spent in each phase (scrape, download, ffmpeg).",
+            labelled=True,
+        )
+        self._metrics = [
+            self.bytes_downloaded,
+            self.download_rate,
+            self.segment_latency,
+            self.retries,
+            self.failures,
+            self.inflight,
+            self.buffered_bytes,
+            self.videos,
+            self.phase_seconds,
+        ]
+        self.path = None
+        self.interval = DEFAULT_INTERVAL
+        self._writer = None
+        self._stop = threading.Event()
+        self._last_write = (time.monotonic(), 0)
+
+    @contextlib.contextmanager
+    def timer(self, phase):
+        """Adds the time spent in the ``with`` block to ``phase``."""
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.phase_seconds.inc(time.monotonic() - start, phase=phase)
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def write(self):
+        if self.path is None:
+            return
+        now = time.monotonic()
+        total = self.bytes_downloaded.value()
+        last_time, last_total = self._last_write
+        if now > last_time:
+            self.download_rate.set((total - last_total) / (now - last_time))
+        self._last_write = (now, total)
+        # write to a temp file first, the collector must never see half a file
+        tmp_path = "{}.{}.tmp".format(self.path, os.getpid())
+        with open(tmp_path, "w") as f:
+            f.write(self.render())
+        os.replace(tmp_path, self.path)
+
+    def configure(self, path=None, interval=DEFAULT_INTERVAL):
+        self.stop()
+        self.path = path
+        self.interval = interval
+        if path is None:
+            return
+        self._stop.clear()
+        self._writer = threading.Thread(
+            target=self._write_periodically, name="echo360-metrics", daemon=True
+        )
+        self._writer.start()
+
+    def stop(self):
+        """Stops the writer, after a final write."""
+        if self._writer is None:
+            return
+        self._stop.set()
+        self._writer.join()
+        self._writer = None
+        self.write()
+
+    def _write_periodically(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.write()
+            except EnvironmentError:
+                # e.g. the directory is gone, try again next time
+                pass
+
+
+_METRICS = Metrics()
+
+
+def get_metrics():
+    return _METRICS
+
+
+def configure(path=None, interval=DEFAULT_INTERVAL):
+    """Starts writing the metrics to ``path`` every ``interval`` seconds."""
+    _METRICS.configure(path, interval)
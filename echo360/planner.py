@@ -0,0 +1,229 @@
+"""
+Estimates of what a run will download, without downloading any segments.
+
+HLS lectures are resolved down to the media playlists the downloader would
+pick, which give the segment counts and durations; their size is
+extrapolated from a few sampled segments. MP4 lectures and segments are sized
+with a 1 byte ranged GET, HEAD being only the fallback as signed (S3) urls
+reject it. The plan is then checked against the free space of the output
+filesystem.
+"""
+import logging
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from .bandwidth import get_limiter
+from . import m3u8
+from .http_cache import get_http_cache
+from .ranged_downloader import probe
+from .variant_policy import VariantPolicy
+from .utils import format_duration, format_size
+
+_LOGGER = logging.getLogger(__name__)
+
+# segments of each playlist whose size is sampled
+SAMPLED_SEGMENTS = 3
+# lectures planned at once
+_PLAN_WORKERS = 8
+
+
+class LecturePlan(object):
+    """
+    What downloading one lecture involves. ``size`` is None when unknown,
+    ``exact`` tells whether it was reported by the server or extrapolated.
+    """
+
+    def __init__(self, filename, segments=0, duration=None, size=None, exact=True):
+        self.filename = filename
+        self.segments = segments
+        self.duration = duration
+        self.size = size
+        self.exact = exact
+        self.error = None
+
+    def __str__(self):
+        if self.error is not None:
+            return "  {}: unknown ({})".format(self.filename, self.error)
+        parts = []
+        if self.size is not None:
+            parts.append(("" if self.exact else "~") + format_size(self.size))
+        if self.segments:
+            parts.append("{} segments".format(self.segments))
+        if self.duration is not None:
+            parts.append(format_duration(self.duration))
+        return "  {}: {}".format(self.filename, ", ".join(parts) or "unknown size")
+
+
+class Planner(object):
+    def __init__(self, session, variant_policy=None, timeout=30):
+        self.session = session
+        self.variant_policy = variant_policy or VariantPolicy()
+        self.timeout = timeout
+
+    def plan(self, jobs):
+        """``LecturePlan``s of ``(filename, video)`` jobs, in their order."""
+        with ThreadPoolExecutor(max_workers=_PLAN_WORKERS) as executor:
+            return list(executor.map(lambda job: self.plan_lecture(*job), jobs))
+
+    def plan_lecture(self, filename, video):
+        plan = LecturePlan(filename)
+        urls = video.url if isinstance(video.url, list) else [video.url]
+        if not getattr(video, "download_alternative_feeds", False):
+            urls = urls[:1]
+        try:
+            for url in urls:
+                self._add_url(plan, url)
+        except (requests.RequestException, ValueError, IndexError) as e:
+            _LOGGER.debug("Failed to plan %s: %s", filename, e)
+            plan.error = str(e) or type(e).__name__
+            plan.size = None
+        return plan
+
+    def _add_url(self, plan, url):
+        if not url.split("?")[0].endswith(".m3u8"):
+            plan.size = (plan.size or 0) + self._remote_size(url)
+            return
+        playlist = self._get(url)
+        if isinstance(playlist, m3u8.MasterPlaylist):
+            # the renditions download_single picks
+            variant = self.variant_policy.select(playlist)
+            if variant is None:
+                raise ValueError("No streams found in {}".format(url))
+            uris = [variant.uri, playlist.audio_for(variant)]
+            playlists = [self._media(uri) for uri in uris if uri is not None]
+        else:
+            playlists = [playlist]
+        duration = 0.0
+        for media in playlists:
+            plan.segments += len(media.segments)
+            duration = max(duration, media.duration)
+            size, exact = self._size(media.segments)
+            plan.size = (plan.size or 0) + size
+            plan.exact = plan.exact and exact
+        plan.duration = (plan.duration or 0) + duration
+
+    def _get(self, url):
+        r, body = get_http_cache().get(self.session, url, timeout=self.timeout)
+        r.raise_for_status()
+        return m3u8.parse(body, url)
+
+    def _media(self, url):
+        """The media playlist at ``url``, following a nested one."""
+        playlist = self._get(url)
+        if isinstance(playlist, m3u8.MasterPlaylist):
+            variant = self.variant_policy.select(playlist)
+            if variant is None:
+                raise ValueError("No streams found in {}".format(url))
+            playlist = self._get(variant.uri)
+        if not isinstance(playlist, m3u8.MediaPlaylist):
+            raise ValueError("Playlists nested too deeply in {}".format(url))
+        return playlist
+
+    def _remote_size(self, url):
+        try:
+            r, size = probe(self.session, url, self.timeout)
+            r.close()
+            if r.status_code == 200 and r.headers.get("content-length"):
+                # the range was ignored, the whole body was announced
+                size = int(r.headers["content-length"])
+            if size is not None:
+                return size
+        except requests.RequestException as e:
+            _LOGGER.debug("Ranged GET of %s failed, trying HEAD: %s", url, e)
+        r = self.session.head(url, allow_redirects=True, timeout=self.timeout)
+        r.raise_for_status()
+        length = r.headers.get("content-length")
+        if length is None:
+            raise ValueError("no Content-Length for {}".format(url))
+        return int(length)
+
+    def _size(self, segments):
+        """
+        Size of ``segments`` and whether it is exact: byte ranges are, the
+        others are extrapolated from a few sampled segments.
+        """
+        if all(s.byterange is not None for s in segments):
+            return sum(s.byterange.length for s in segments), True
+        if not segments:
+            return 0, True
+        step = max(1, len(segments) // SAMPLED_SEGMENTS)
+        sampled = segments[::step][:SAMPLED_SEGMENTS]
+        size = sum(self._remote_size(s.uri) for s in sampled)
+        sampled_duration = sum(s.duration for s in sampled)
+        total_duration = sum(s.duration for s in segments)
+        if sampled_duration and total_duration:
+            return int(size * total_duration / sampled_duration), False
+        return size * len(segments) // len(sampled), False
+
+
+def free_space(path):
+    """Free bytes on the filesystem ``path`` is (or will be) created on."""
+    path = os.path.abspath(path)
+    while not os.path.exists(path):
+        path = os.path.dirname(path)
+    return shutil.disk_usage(path).free
+
+
+def unknown(plans):
+    """The plans whose size couldn't be found out."""
+    return [p for p in plans if p.size is None]
+
+
+def required_space(plans):
+    """
+    Bytes needed for ``plans``: the downloads plus, while a lecture is
+    remuxed, a second copy of it. Lectures of unknown size aren't included.
+    """
+    sizes = [p.size or 0 for p in plans]
+    return sum(sizes) + max(sizes, default=0)
+
+
+def trim(plans, free):
+    """
+    The longest prefix of ``plans`` known to fit in ``free`` bytes, which
+    ends before the first lecture of unknown size.
+    """
+    missing = unknown(plans)
+    if missing:
+        plans = plans[: plans.index(missing[0])]
+    for n in range(len(plans), -1, -1):
+        if required_space(plans[:n]) <= free:
+            return plans[:n]
+    return []
+
+
+def report(plans, free):
+    """The summary printed in plan mode and by the disk space check."""
+    bar = "=" * 65
+    total = sum(p.size or 0 for p in plans)
+    lines = [bar, "    Download plan:"]
+    lines += [str(p) for p in plans]
+    lines.append(bar)
+    lines.append(
+        "    Total: {} lectures, ~{} in {} segments, {} of media".format(
+            len(plans),
+            format_size(total),
+            sum(p.segments for p in plans),
+            format_duration(sum(p.duration or 0 for p in plans)),
+        )
+    )
+    missing = len(unknown(plans))
+    if missing:
+        lines.append("    ({} lecture(s) of unknown size not included)".format(missing))
+    rate = get_limiter().current_rate()
+    if rate:
+        lines.append(
+            "    At the bandwidth limit this takes about {}".format(
+                format_duration(total / rate)
+            )
+        )
+    lines.append(
+        "    Free space: {}, needed: ~{}".format(
+            format_size(free), format_size(required_space(plans))
+        )
+    )
+    lines.append(bar)
+    return "\n".join(lines)
@@ -0,0 +1,203 @@
+"""
+Progress display shared by all concurrent downloads.
+
+Workers only append their updates to a deque (which is thread-safe without a
+lock), and a background thread folds them into the counters and redraws the
+display a few times per second: one line per active lecture plus a total. When
+stdout is not a terminal a periodic log line is written instead.
+"""
+import collections
+import logging
+import sys
+import threading
+import time
+
+_LOGGER = logging.getLogger(__name__)
+
+DEFAULT_REFRESH = 0.25
+DEFAULT_LOG_INTERVAL = 10.0
+_BAR_LENGTH = 20
+_NAME_LENGTH = 40
+# seconds of history the total rate is averaged over
+_RATE_WINDOW = 5.0
+# kinds of queued events
+_ADD, _UPDATE, _CLOSE, _MESSAGE = range(4)
+
+
+def _format_bytes(nbytes):
+    return "{:.1f} MB".format(nbytes / 1e6)
+
+
+class ProgressTask(object):
+    """
+    Progress of one download, counted in ``unit`` ("segments" or "bytes").
+    Its counters belong to the renderer, ``update`` merely queues.
+    """
+
+    def __init__(self, renderer, name, total, unit="segments", initial=0):
+        self._renderer = renderer
+        self.name = name
+        self.total = total
+        self.unit = unit
+        self.done = initial
+        self.ok = True
+
+    def update(self, n=1, nbytes=0):
+        """``n`` more units done, ``nbytes`` of which were downloaded."""
+        self._renderer._events.append((_UPDATE, self, n, nbytes))
+
+    def close(self, ok=True):
+        """Finishes the task and prints its final line straight away."""
+        self.ok = ok
+        self._renderer._events.append((_CLOSE, self, None, 0))
+        self._renderer.flush()
+
+    def _format(self, final=False):
+        name = self.name
+        if len(name) > _NAME_LENGTH:
+            name = name[: _NAME_LENGTH - 3] + "..."
+        progress = min(1.0, float(self.done) / self.total) if self.total else 0.0
+        if self.unit == "bytes":
+            status = "{}/{}".format(_format_bytes(self.done), _format_bytes(self.total))
+        else:
+            status = "{}/{}".format(self.done, self.total)
+        if final:
+            status += " Done!" if self.ok else " Failed!"
+        block = "=" * int(round(_BAR_LENGTH * progress))
+        if len(block) < _BAR_LENGTH:
+            block += ">"
+        return "  > {}: [{}] {:.2f}% {}".format(
+            name, block.ljust(_BAR_LENGTH), progress * 100, status
+        )
+
+
+class ProgressRenderer(object):
+    def __init__(
+        self, stream=None, refresh=DEFAULT_REFRESH, log_interval=DEFAULT_LOG_INTERVAL
+    ):
+        self._stream = stream
+        self.refresh = refresh
+        self.log_interval = log_interval
+        self._events = collections.deque()
+        self._tasks = []
+        self._render_lock = threading.Lock()
+        self._thread_lock = threading.Lock()
+        self._thread = None
+        # lines of the live display currently on screen
+        self._drawn = 0
+        self._total_bytes = 0
+        self._rate_samples = collections.deque()
+        self._last_log = time.monotonic()
+
+    @property
+    def stream(self):
+        return self._stream or sys.stdout
+
+    @property
+    def interactive(self):
+        try:
+            return self.stream.isatty()
+        except (AttributeError, ValueError):
+            return False
+
+    def task(self, name, total, unit="segments", initial=0):
+        task = ProgressTask(self, name, total, unit, initial)
+        self._events.append((_ADD, task, None, 0))
+        with self._thread_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="echo360-progress", daemon=True
+                )
+                self._thread.start()
+        return task
+
+    def message(self, text):
+        """Prints ``text`` above the live display, without garbling it."""
+        self._events.append((_MESSAGE, None, text, 0))
+        self.flush()
+
+    def flush(self):
+        with self._render_lock:
+            self._render()
+
+    def _run(self):
+        while True:
+            time.sleep(self.refresh)
+            with self._render_lock:
+                self._render()
+            with self._thread_lock:
+                if not self._tasks and not self._events:
+                    self._thread = None
+                    return
+
+    def _drain(self):
+        """Applies the queued events, returns the lines to print for good."""
+        finished = []
+        while self._events:
+            kind, task, value, nbytes = self._events.popleft()
+            if kind == _UPDATE:
+                task.done += value
+                self._total_bytes += nbytes
+            elif kind == _ADD:
+                self._tasks.append(task)
+            elif kind == _CLOSE:
+                self._tasks.remove(task)
+                finished.append(task._format(final=True))
+            else:
+                finished.append(value)
+        return finished
+
+    def _total_line(self):
+        now = time.monotonic()
+        self._rate_samples.append((now, self._total_bytes))
+        # keep the newest sample that is at least a window old
+        while (
+            len(self._rate_samples) > 2
+            and now - self._rate_samples[1][0] >= _RATE_WINDOW
+        ):
+            self._rate_samples.popleft()
+        first_time, first_bytes = self._rate_samples[0]
+        rate = 0.0
+        if now > first_time:
+            rate = (self._total_bytes - first_bytes) / (now - first_time)
+        return "  Total: {} active, {} at {}/s".format(
+            len(self._tasks), _format_bytes(self._total_bytes), _format_bytes(rate)
+        )
+
+    def _render(self):
+        finished = self._drain()
+        if not self.interactive:
+            for line in finished:
+                self.stream.write(line.strip() + "\n")
+            now = time.monotonic()
+            if self._tasks and now - self._last_log >= self.log_interval:
+                self._last_log = now
+                _LOGGER.info(
+                    "Progress: %s; %s",
+                    "; ".join(t._format().strip() for t in self._tasks),
+                    self._total_line().strip(),
+                )
+            self.stream.flush()
+            return
+        out = []
+        if self._drawn:
+            # back to the first line of the live display
+            out.append("\x1b[{}F".format(self._drawn))
+        for line in finished:
+            out.append("\x1b[K" + line + "\n")
+        lines = [t._format() for t in self._tasks]
+        if lines:
+            lines.append(self._total_line())
+        for line in lines:
+            out.append("\x1b[K" + line + "\n")
+        out.append("\x1b[J")
+        self._drawn = len(lines)
+        self.stream.write("".join(out))
+        self.stream.flush()
+
+
+_RENDERER = ProgressRenderer()
+
+
+def get_progress():
+    return _RENDERER
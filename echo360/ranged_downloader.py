@@ -0,0 +1,308 @@
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from .bandwidth import get_limiter
+from .metrics import get_metrics
+from .progress import get_progress
+from .retry import (
+    CircuitBreaker,
+    OVERLOAD_STATUS,
+    RetryPolicy,
+    is_fatal_error,
+    is_transient_error,
+    parse_retry_after,
+)
+from .streaming import DEFAULT_CHUNK_SIZE, get_buffer_pool, iter_body, write_body
+
+_LOGGER = logging.getLogger(__name__)
+
+DEFAULT_PARTS = 8
+# don't bother splitting files into parts smaller than this
+MIN_PART_SIZE = 4 * 1024 * 1024
+# how much a part writes between flushing its progress to the state file
+SYNC_BYTES = 8 * 1024 * 1024
+
+
+def _strip_query(url):
+    return url.split("?")[0]
+
+
+def _content_range_total(content_range):
+    # "bytes 0-0/12345" -> 12345
+    try:
+        return int(content_range.rsplit("/", 1)[1])
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+
+def probe(session, url, timeout=20):
+    """
+    A 1 byte ranged GET of ``url``: it tells both the size and whether ranges
+    work, and unlike HEAD it is allowed by GET-only signed (S3) urls. Returns
+    the (still open) response and the size, None if the range was ignored.
+    Raises HTTPError for an unsuccessful response.
+    """
+    r = session.get(url, headers={"Range": "bytes=0-0"}, stream=True, timeout=timeout)
+    if not r.ok:
+        r.close()
+        # carries the response, so its status decides about retrying
+        raise requests.HTTPError(
+            "Failed to download {} (status code {})".format(url, r.status_code),
+            response=r,
+        )
+    size = _content_range_total(r.headers.get("content-range"))
+    if r.status_code != 206:
+        size = None
+    return r, size
+
+
+class RangedDownloader(object):
+    """
+    Downloads a single (large) file, e.g. a lecture mp4, with several
+    concurrent byte-range requests.
+
+    The file is split by its size into ``parts`` ranges that are written at
+    their offsets in a preallocated output file. Progress of each part is kept
+    in ``<path>.parts``, so an interrupted download resumes each part from
+    where it stopped. A failed part is retried from there as ``retry_policy``
+    allows, with backoff and the host's circuit breaker. Servers that don't
+    honour ranges are streamed over a single connection instead.
+    """
+
+    def __init__(
+        self,
+        session,
+        parts=DEFAULT_PARTS,
+        retry_policy=None,
+        timeout=20,
+        chunk_size=DEFAULT_CHUNK_SIZE,
+    ):
+        self.session = session
+        self.parts = parts
+        self.pool = get_buffer_pool(chunk_size)
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._state = None
+        self._state_path = None
+        self._last_sync = 0.0
+        self._progress = None
+        # of the downloaded file, as reported by the server
+        self.etag = None
+
+    def download(self, url, path, name=None):
+        """``name`` is shown in the progress display, the file name by default."""
+        name = name or os.path.basename(path)
+        r, size = self._with_retry(
+            url, lambda: probe(self.session, url, self.timeout)
+        )
+        self.etag = r.headers.get("etag")
+        if size is None:
+            _LOGGER.debug("Server does not support ranges, using a single stream")
+            self._download_single_stream(r, path, name)
+            return path
+        r.close()
+        self._download_ranges(url, path, size, name)
+        return path
+
+    def _download_single_stream(self, r, path, name):
+        total_size = int(r.headers.get("content-length", 0))
+        limiter = get_limiter()
+        downloaded = get_metrics().bytes_downloaded
+        progress = get_progress().task(name, total_size, unit="bytes")
+
+        def on_chunk(nbytes):
+            limiter.consume(nbytes)
+            downloaded.inc(nbytes)
+            progress.update(nbytes, nbytes)
+
+        ok = False
+        try:
+            with open(path, "wb") as f:
+                write_body(r, f, self.pool, on_chunk)
+            ok = True
+        finally:
+            progress.close(ok)
+
+    def _download_ranges(self, url, path, size, name):
+        self._state_path = path + ".parts"
+        self._state = self._load_state(url, path, size)
+        if not os.path.exists(path):
+            with open(path, "wb") as f:
+                # preallocate, parts are written at their own offsets
+                f.truncate(size)
+        done = sum(part[2] for part in self._state["parts"])
+        if done:
+            get_progress().message(
+                "  > Resuming, {:.1f} MB already downloaded".format(done / 1e6)
+            )
+        remaining = [
+            i
+            for i, (start, end, got) in enumerate(self._state["parts"])
+            if start + got <= end
+        ]
+        self._progress = get_progress().task(name, size, unit="bytes", initial=done)
+        ok = False
+        try:
+            with ThreadPoolExecutor(max_workers=max(1, len(remaining))) as executor:
+                list(
+                    executor.map(
+                        lambda i: self._download_part(url, path, i), remaining
+                    )
+                )
+            ok = True
+        finally:
+            self._progress.close(ok)
+            self._progress = None
+        os.remove(self._state_path)
+
+    def _load_state(self, url, path, size):
+        if os.path.exists(self._state_path) and os.path.exists(path):
+            try:
+                with open(self._state_path, "r") as f:
+                    state = json.load(f)
+                if state["url"] == _strip_query(url) and state["size"] == size:
+                    return state
+            except (ValueError, KeyError, EnvironmentError) as e:
+                _LOGGER.debug("Ignoring unreadable %s: %s", self._state_path, e)
+        if os.path.exists(path):
+            # a leftover we have no (matching) state for, can't trust its content
+            os.remove(path)
+        parts = max(1, min(self.parts, size // MIN_PART_SIZE))
+        part_size = -(-size // parts)  # ceil
+        return {
+            "url": _strip_query(url),
+            "size": size,
+            # [first byte, last byte, bytes done]
+            "parts": [
+                [start, min(start + part_size, size) - 1, 0]
+                for start in range(0, size, part_size)
+            ],
+        }
+
+    def _save_state(self, force=False):
+        with self._lock:
+            now = time.monotonic()
+            if not force and now - self._last_sync < 1.0:
+                return
+            self._last_sync = now
+            tmp_path = self._state_path + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(self._state, f)
+            os.replace(tmp_path, self._state_path)
+
+    def _download_part(self, url, path, index):
+        part = self._state["parts"][index]
+
+        def fetch():
+            start, end, got = part
+            if start + got > end:
+                return
+            try:
+                self._fetch_range(url, path, part)
+            except Exception:
+                # keep what we got so far, and continue from there
+                self._save_state(force=True)
+                raise
+
+        self._with_retry(url, fetch, position=lambda: part[2])
+
+    def _with_retry(self, url, fetch, position=None):
+        """
+        Calls ``fetch`` until it succeeds and returns its result. Failures are
+        retried with backoff as ``retry_policy`` allows and count towards the
+        host's circuit breaker when they look like overload. If ``position``
+        is given, only consecutive failures that didn't move it count.
+        """
+        breaker = CircuitBreaker.for_url(url)
+        attempt = 0
+        while True:
+            breaker.wait()
+            before = position() if position is not None else None
+            try:
+                result = fetch()
+            except Exception as e:
+                if is_fatal_error(e):
+                    raise
+                r = getattr(e, "response", None)
+                if r is None and not is_transient_error(e):
+                    raise
+                failure = e
+                error = e if r is None else None
+            else:
+                breaker.record_success()
+                return result
+            if position is not None and position() != before:
+                # it moved on, only consecutive failures count
+                attempt = 0
+            attempt += 1
+            status = r.status_code if r is not None else None
+            headers = r.headers if r is not None else None
+            if error is not None or status in OVERLOAD_STATUS:
+                breaker.record_failure(
+                    parse_retry_after(headers.get("retry-after")) if headers else None
+                )
+            if not self.retry_policy.should_retry(attempt, status, error):
+                get_metrics().failures.inc()
+                raise failure
+            get_metrics().retries.inc()
+            delay = self.retry_policy.delay(attempt, status, headers)
+            _LOGGER.debug(
+                "Retrying %s in %.1fs (attempt %d): %s",
+                url,
+                delay,
+                attempt,
+                error or "status code {}".format(status),
+            )
+            time.sleep(delay)
+
+    def _fetch_range(self, url, path, part):
+        start, end, got = part
+        r = self.session.get(
+            url,
+            headers={"Range": "bytes={}-{}".format(start + got, end)},
+            stream=True,
+            timeout=self.timeout,
+        )
+        if r.status_code != 206:
+            r.close()
+            raise requests.HTTPError(
+                "Expected a partial response, got status code {}".format(
+                    r.status_code
+                ),
+                response=r,
+            )
+        limiter = get_limiter()
+        downloaded = get_metrics().bytes_downloaded
+        with open(path, "r+b") as f:
+            f.seek(start + got)
+            unsynced = 0
+            try:
+                for data in iter_body(r, self.pool):
+                    limiter.consume(len(data))
+                    downloaded.inc(len(data))
+                    f.write(data)
+                    unsynced += len(data)
+                    self._progress.update(len(data), len(data))
+                    if unsynced >= SYNC_BYTES:
+                        f.flush()
+                        os.fsync(f.fileno())
+                        part[2] += unsynced
+                        unsynced = 0
+                        self._save_state()
+            except Exception:
+                # the retry fetches these again, don't count them twice
+                self._progress.update(-unsynced, 0)
+                raise
+            f.flush()
+            os.fsync(f.fileno())
+            part[2] += unsynced
+        if start + part[2] <= end:
+            raise IOError("Connection closed before the part completed")
+        self._save_state(force=True)
@@ -0,0 +1,142 @@
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+
+from .echo_exceptions import HlsDownloaderError
+
+_LOGGER = logging.getLogger(__name__)
+
+MUX_AUTO = "auto"
+MUX_COPY = "copy"
+MUX_AC3 = "ac3"
+MUX_MODES = (MUX_AUTO, MUX_COPY, MUX_AC3)
+# audio codecs (as ffprobe names them) an MP4 can hold as they are
+MP4_AUDIO_CODECS = frozenset(["aac", "mp3", "ac3", "eac3", "alac"])
+
+
+def ffmpeg_available():
+    return shutil.which("ffmpeg") is not None
+
+
+def probe_audio_codecs(path):
+    """
+    Codec names of the audio streams in ``path``, or None if ffprobe is not
+    installed or couldn't read the file.
+    """
+    if shutil.which("ffprobe") is None:
+        return None
+    cmd = [
+        "ffprobe",
+        "-v",
+        "error",
+        "-select_streams",
+        "a",
+        "-show_entries",
+        "stream=codec_name",
+        "-of",
+        "csv=p=0",
+        path,
+    ]
+    try:
+        out = subprocess.run(
+            cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=True
+        ).stdout
+    except (OSError, subprocess.CalledProcessError) as e:
+        _LOGGER.debug("Failed to probe %s: %s", path, e)
+        return None
+    return [line.strip() for line in out.decode().splitlines() if line.strip()]
+
+
+def audio_options(paths, mode=MUX_AUTO):
+    """
+    ffmpeg output options for the audio when muxing ``paths`` into an MP4.
+
+    ``copy`` keeps the audio as it is and ``ac3`` re-encodes it. ``auto``
+    copies when every audio stream probes as MP4-compatible (the AAC the
+    playlists advertise as ``mp4a.40.2``), re-encodes when one isn't, and
+    returns None when it can't tell, leaving the choice to the caller.
+    """
+    if mode not in MUX_MODES:
+        raise ValueError(
+            "Unknown mux mode {!r}, expected one of {}".format(mode, MUX_MODES)
+        )
+    if mode == MUX_COPY:
+        return ["-c:a", "copy"]
+    if mode == MUX_AC3:
+        return ["-c:a", "ac3"]
+    codecs = []
+    for path in paths:
+        probed = probe_audio_codecs(path)
+        if probed is None:
+            return None
+        codecs.extend(probed)
+    if all(codec in MP4_AUDIO_CODECS for codec in codecs):
+        return ["-c:a", "copy"]
+    _LOGGER.debug("Re-encoding audio, %s can't be copied into mp4", codecs)
+    return ["-c:a", "ac3"]
+
+
+class FFmpegPipe(object):
+    """
+    A long-running ffmpeg remuxing everything written to it into ``output``.
+
+    The downloader writes the segments in order as they arrive, so the MP4 is
+    complete moments after the last segment without an intermediate file on
+    disk. If ffmpeg can't keep up, ``write`` blocks and holds the download
+    back. ``input_format`` is passed as ``-f`` (e.g. "mpegts"), as a pipe
+    can't always be probed reliably.
+    """
+
+    def __init__(self, output, input_format=None, output_options=("-c", "copy")):
+        self.output = output
+        cmd = ["ffmpeg", "-nostdin", "-loglevel", "error", "-y"]
+        if input_format:
+            cmd += ["-f", input_format]
+        cmd += ["-i", "pipe:0"] + list(output_options) + [output]
+        _LOGGER.debug("Starting %s", " ".join(cmd))
+        # a file rather than a pipe, nobody reads it while we are writing
+        self._stderr = tempfile.TemporaryFile()
+        self._proc = subprocess.Popen(
+            cmd, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=self._stderr
+        )
+
+    def write(self, data):
+        try:
+            self._proc.stdin.write(data)
+        except BrokenPipeError:
+            raise HlsDownloaderError(self._failure(self._proc.wait()))
+
+    def finish(self):
+        """Waits for ffmpeg to write the rest of ``output``."""
+        try:
+            self._proc.stdin.close()
+        except BrokenPipeError:
+            pass
+        returncode = self._proc.wait()
+        if returncode != 0:
+            message = self._failure(returncode)
+            self._remove_output()
+            raise HlsDownloaderError(message)
+        self._stderr.close()
+
+    def abort(self):
+        """Stops ffmpeg and removes the incomplete output."""
+        self._proc.kill()
+        self._proc.wait()
+        try:
+            self._proc.stdin.close()
+        except BrokenPipeError:
+            pass
+        self._stderr.close()
+        self._remove_output()
+
+    def _failure(self, returncode):
+        self._stderr.seek(0)
+        error = self._stderr.read().decode(errors="replace").strip()
+        return "ffmpeg exited with status {}: {}".format(returncode, error[-500:])
+
+    def _remove_output(self):
+        if os.path.exists(self.output):
+            os.remove(self.output)
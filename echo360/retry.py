@@ -0,0 +1,190 @@
+import datetime
+import email.utils
+import errno
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+from .progress import get_progress
+
+# worth another try, possibly after a while
+RETRYABLE_STATUS = {408, 425, 429, 500, 502, 503, 504}
+# the origin telling us it's overloaded; these count towards the circuit breaker
+OVERLOAD_STATUS = {429, 502, 503, 504}
+# failed attempts a lecture may retry, at least; large lectures get 10% of
+# their segment count
+DEFAULT_FAILURE_BUDGET = 20
+# a full disk etc. won't get better by retrying
+_FATAL_ERRNOS = {errno.ENOSPC, errno.EROFS, errno.EACCES, errno.EPERM, errno.ENOENT}
+if hasattr(errno, "EDQUOT"):
+    _FATAL_ERRNOS.add(errno.EDQUOT)
+# e.g. http.client.IncompleteRead or aiohttp.ClientPayloadError
+_TRANSIENT_MODULES = ("http", "requests", "urllib3", "aiohttp")
+
+
+def connection_retries(max_retries):
+    """
+    ``max_retries`` for ``HTTPAdapter``: retries failed connects only, like an
+    int does, but without urllib3 silently sleeping off Retry-After headers;
+    those are left to RetryPolicy and the circuit breaker.
+    """
+    from urllib3.util.retry import Retry
+
+    return Retry(max_retries, read=False, respect_retry_after_header=False)
+
+
+def is_fatal_error(error):
+    """Local (disk) errors that should abort instead of being retried."""
+    return isinstance(error, EnvironmentError) and error.errno in _FATAL_ERRNOS
+
+
+def is_transient_error(error):
+    """
+    Network errors worth retrying: (non-fatal) socket errors and the
+    exceptions of the HTTP libraries, but not bugs such as a TypeError.
+    """
+    if is_fatal_error(error):
+        return False
+    if isinstance(error, EnvironmentError):
+        return True
+    return type(error).__module__.split(".")[0] in _TRANSIENT_MODULES
+
+
+def parse_retry_after(value):
+    """Seconds to wait from a Retry-After header (delta-seconds or HTTP date)."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        date = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    now = datetime.datetime.now(date.tzinfo)
+    return max(0.0, (date - now).total_seconds())
+
+
+class RetryPolicy(object):
+    """
+    Bounded retries with exponential backoff and (full) jitter.
+
+    Only network errors and retryable statuses are retried, e.g. a 403 or 404
+    is given up on straight away. For 429/503 the server's ``Retry-After`` is
+    respected (up to ``max_retry_after``).
+    """
+
+    def __init__(
+        self, max_attempts=5, base_delay=0.5, max_delay=30.0, max_retry_after=300.0
+    ):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_retry_after = max_retry_after
+
+    def should_retry(self, attempt, status=None, error=None):
+        """``attempt`` is the number of attempts made so far."""
+        if attempt >= self.max_attempts:
+            return False
+        if error is not None:
+            return is_transient_error(error)
+        return status in RETRYABLE_STATUS
+
+    def delay(self, attempt, status=None, headers=None):
+        if status in (429, 503) and headers is not None:
+            retry_after = parse_retry_after(headers.get("retry-after"))
+            if retry_after is not None:
+                return min(retry_after, self.max_retry_after)
+        backoff = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        return random.uniform(0, backoff)
+
+
+class FailureBudget(object):
+    """
+    Number of failed attempts one lecture may spend on retries in total. Once
+    it is used up the lecture is given up on, instead of retrying each of its
+    segments to the limit against a broken origin.
+    """
+
+    def __init__(self, max_failures):
+        self.max_failures = max_failures
+        self.used = 0
+        self._lock = threading.Lock()
+
+    @property
+    def exhausted(self):
+        return self.used >= self.max_failures
+
+    def spend(self):
+        """Takes one failure from the budget, False if there was none left."""
+        with self._lock:
+            if self.used >= self.max_failures:
+                return False
+            self.used += 1
+            return True
+
+
+class CircuitBreaker(object):
+    """
+    Per-host circuit breaker. After ``threshold`` consecutive overload
+    failures (429/5xx, timeouts, connection errors) it opens and every worker
+    talking to that host pauses in ``wait`` for the cool-down, which doubles
+    each time the host is still overloaded afterwards.
+    """
+
+    _breakers = {}
+    _breakers_lock = threading.Lock()
+
+    def __init__(self, host, threshold=5, cooldown=5.0, max_cooldown=120.0):
+        self.host = host
+        self.threshold = threshold
+        self.base_cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self._cooldown = cooldown
+        self._failures = 0
+        self._open_until = 0.0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def for_url(cls, url):
+        """The process-wide breaker for the host of ``url``."""
+        host = urlsplit(url).netloc.lower()
+        with cls._breakers_lock:
+            if host not in cls._breakers:
+                cls._breakers[host] = cls(host)
+            return cls._breakers[host]
+
+    @property
+    def is_open(self):
+        return time.monotonic() < self._open_until
+
+    def wait(self):
+        while True:
+            remaining = self._open_until - time.monotonic()
+            if remaining <= 0:
+                return
+            time.sleep(remaining)
+
+    def record_success(self):
+        if self._failures:
+            with self._lock:
+                self._failures = 0
+                self._cooldown = self.base_cooldown
+
+    def record_failure(self, retry_after=None):
+        with self._lock:
+            self._failures += 1
+            if self._failures < self.threshold or self.is_open:
+                return
+            cooldown = max(self._cooldown, retry_after or 0)
+            self._open_until = time.monotonic() + cooldown
+            get_progress().message(
+                "[WARN] {} looks overloaded, pausing for {:.0f}s".format(
+                    self.host, cooldown
+                )
+            )
+            self._cooldown = min(self._cooldown * 2, self.max_cooldown)
+            # a single failure after the pause re-opens the circuit
+            self._failures = self.threshold - 1
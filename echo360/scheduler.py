@@ -0,0 +1,95 @@
+"""
+Runs several lecture downloads at once.
+
+The lectures share the process-wide bandwidth limit and one segment
+concurrency controller, so running more of them side by side doesn't raise
+the load on the CDN, it only keeps the link busy while one lecture waits for
+its slowest segments or is being muxed. Lectures are started longest first
+(by the total duration of their playlists), so a long lecture doesn't end up
+running alone at the end. Results are reported in the original order.
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from . import m3u8
+from .http_cache import get_http_cache
+
+_LOGGER = logging.getLogger(__name__)
+
+DEFAULT_PARALLEL_LECTURES = 1
+# playlists fetched at once while estimating durations
+_ESTIMATE_WORKERS = 8
+
+
+def playlist_duration(session, url, timeout=30):
+    """
+    Seconds of media in the HLS playlist at ``url``, following the first
+    variant of a master playlist. None if it isn't a playlist or can't be read.
+    """
+    for _ in range(2):
+        if not url.split("?")[0].endswith(".m3u8"):
+            return None
+        r, body = get_http_cache().get(session, url, timeout=timeout)
+        r.raise_for_status()
+        playlist = m3u8.parse(body, url)
+        if isinstance(playlist, m3u8.MediaPlaylist):
+            return playlist.duration
+        # a master playlist, all variants have the same duration
+        variant = playlist.default_variant()
+        if variant is None:
+            return None
+        url = variant.uri
+    return None
+
+
+class LectureScheduler(object):
+    """
+    Downloads ``(filename, video)`` jobs, ``max_parallel`` at a time, with
+    ``download(filename, video)`` returning whether the lecture succeeded.
+    """
+
+    def __init__(self, max_parallel=DEFAULT_PARALLEL_LECTURES, session=None):
+        self.max_parallel = max(1, max_parallel)
+        self.session = session
+
+    def order(self, jobs, durations=None):
+        """
+        Indices of ``jobs`` longest first, by ``durations`` if they are known
+        already. Lectures of unknown length go last, in their original order.
+        """
+        if self.max_parallel == 1 or (durations is None and self.session is None):
+            return list(range(len(jobs)))
+        if durations is None:
+            with ThreadPoolExecutor(max_workers=_ESTIMATE_WORKERS) as executor:
+                durations = list(executor.map(self._duration, jobs))
+        for (filename, _), duration in zip(jobs, durations):
+            _LOGGER.debug("Estimated %s to last %s seconds", filename, duration)
+        return sorted(
+            range(len(jobs)),
+            key=lambda i: (durations[i] is None, -(durations[i] or 0), i),
+        )
+
+    def run(self, jobs, download, durations=None):
+        """Returns the results of ``download`` in the order of ``jobs``."""
+        order = self.order(jobs, durations)
+        if self.max_parallel == 1:
+            return [download(*jobs[i]) for i in order]
+        results = [None] * len(jobs)
+        with ThreadPoolExecutor(max_workers=self.max_parallel) as executor:
+            # submitted longest first, the pool starts them in that order
+            futures = {i: executor.submit(download, *jobs[i]) for i in order}
+        for i, future in futures.items():
+            results[i] = future.result()
+        return results
+
+    def _duration(self, job):
+        url = job[1].url
+        if isinstance(url, list):
+            url = url[0] if url else None
+        if not url:
+            return None
+        try:
+            return playlist_duration(self.session, url)
+        except Exception as e:
+            _LOGGER.debug("Failed to estimate the duration of %s: %s", url, e)
+            return None
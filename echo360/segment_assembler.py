@@ -0,0 +1,164 @@
+import logging
+import threading
+
+_LOGGER = logging.getLogger(__name__)
+
+# Upper bound on the bytes held in memory for segments that arrived ahead of
+# the one we are waiting for. Workers with segments further ahead wait.
+DEFAULT_WINDOW_BYTES = 32 * 1024 * 1024
+
+
+class SegmentAssembler(object):
+    """
+    Writes downloaded segments into a single output file in playlist order.
+
+    Workers hand over each completed segment with ``add``. If it is the next
+    segment in line it (and any buffered successors) is written straight away,
+    so the output grows as soon as the head of the playlist is available.
+    Segments that arrive early are kept in an in-memory reorder window of
+    ``window_bytes``. A worker whose segment doesn't fit in the window waits
+    in ``add`` until the head has advanced, so there are no temp files and
+    memory stays near one window.
+
+    When resuming, ``start`` is the first segment not yet in ``outfile`` and
+    ``window`` maps indices to the segments (bytes) the previous run held in
+    its window. If a ``journal`` is given, progress is recorded in it as the
+    output grows, and ``close`` saves the window of a failed run in it.
+
+    Segments handed to ``add`` are expected to be reserved in ``budget`` (a
+    MemoryBudget), which is released once they are written.
+    """
+
+    def __init__(
+        self,
+        outfile,
+        total,
+        window_bytes=DEFAULT_WINDOW_BYTES,
+        start=0,
+        window=None,
+        journal=None,
+        budget=None,
+    ):
+        self._outfile = outfile
+        self._budget = budget
+        self._total = total
+        self._window_bytes = window_bytes
+        self._journal = journal
+        self._next = start
+        # index -> bytes of the segments that arrived early
+        self._pending = dict(window or {})
+        self._pending_bytes = sum(len(data) for data in self._pending.values())
+        if self._budget is not None:
+            # read back from disk, count them like downloaded ones
+            self._budget.resize(0, self._pending_bytes)
+        self._aborted = False
+        self._closed = False
+        self._cond = threading.Condition()
+        self._finished = threading.Event()
+        with self._cond:
+            self._drain()
+        if self._next >= total:
+            self._finished.set()
+
+    @property
+    def next_index(self):
+        return self._next
+
+    @property
+    def finished(self):
+        return self._finished.is_set()
+
+    @property
+    def aborted(self):
+        return self._aborted
+
+    def add(self, index, data):
+        with self._cond:
+            # backpressure: wait for the head to make room (an empty window
+            # takes any segment, however large)
+            while (
+                index > self._next
+                and self._pending
+                and self._pending_bytes + len(data) > self._window_bytes
+                and not self._aborted
+            ):
+                self._cond.wait()
+            if (
+                self._closed
+                or index < self._next
+                or index in self._pending
+                or (
+                    index > self._next
+                    and self._pending
+                    and self._pending_bytes + len(data) > self._window_bytes
+                )
+            ):
+                # closed, a duplicated delivery (e.g. a retried segment), or
+                # no room in the window of an aborted download
+                self._release(len(data))
+                return
+            if index > self._next:
+                # (an aborted download keeps it too, for resuming)
+                self._pending[index] = data
+                self._pending_bytes += len(data)
+                return
+            try:
+                self._write(data)
+                self._drain()
+            finally:
+                self._release(len(data))
+                self._cond.notify_all()
+            self._record(force=self.finished)
+
+    def wait(self, timeout=None):
+        return self._finished.wait(timeout)
+
+    def abort(self):
+        """
+        Gives up: workers no longer wait in ``add``, segments that fit in the
+        window are still kept (for ``close`` to save).
+        """
+        with self._cond:
+            self._aborted = True
+            self._cond.notify_all()
+
+    def close(self, keep_window=False):
+        """
+        Releases buffered segments. With ``keep_window`` (a failed journaled
+        run) they are saved in the journal for the next run first.
+        """
+        with self._cond:
+            self._aborted = self._closed = True
+            self._cond.notify_all()
+            self._record(force=True)
+            if keep_window and self._journal is not None and self._pending:
+                try:
+                    self._journal.save_window(self._pending)
+                except EnvironmentError as e:
+                    # they'll be downloaded again, don't mask the original error
+                    _LOGGER.debug("Failed to save the reorder window: %s", e)
+            self._pending.clear()
+            self._release(self._pending_bytes)
+            self._pending_bytes = 0
+
+    def _record(self, force=False):
+        if self._journal is None:
+            return
+        self._journal.record(self._next, self._outfile, force=force)
+
+    def _write(self, data):
+        self._outfile.write(data)
+        self._next += 1
+        if self._next >= self._total:
+            self._finished.set()
+
+    def _drain(self):
+        while self._next in self._pending:
+            data = self._pending.pop(self._next)
+            self._pending_bytes -= len(data)
+            self._release(len(data))
+            self._write(data)
+
+    def _release(self, nbytes):
+        if self._budget is not None:
+            self._budget.release(nbytes)
@@ -0,0 +1,187 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from .utils import parse_size
+
+_LOGGER = logging.getLogger(__name__)
+
+DEFAULT_MAX_SIZE = "10G"
+
+# query parameters of signed (CloudFront / S3) urls that change on every run
+# while pointing at the very same object.
+_VOLATILE_PARAMS = {
+    "policy",
+    "signature",
+    "key-pair-id",
+    "expires",
+    "x-amz-algorithm",
+    "x-amz-credential",
+    "x-amz-date",
+    "x-amz-expires",
+    "x-amz-security-token",
+    "x-amz-signature",
+    "x-amz-signedheaders",
+}
+
+
+def normalise_url(url):
+    """
+    Canonical form of a segment url for cache keys: lowercase scheme and host,
+    no default port or fragment, no signing parameters and a sorted query.
+    """
+    parts = urlsplit(url)
+    scheme = parts.scheme.lower()
+    netloc = parts.netloc.lower()
+    if (scheme, netloc.rsplit(":", 1)[-1]) in (("http", "80"), ("https", "443")):
+        netloc = netloc.rsplit(":", 1)[0]
+    query = sorted(
+        (k, v)
+        for k, v in parse_qsl(parts.query, keep_blank_values=True)
+        if k.lower() not in _VOLATILE_PARAMS
+    )
+    return urlunsplit((scheme, netloc, parts.path, urlencode(query), ""))
+
+
+class SegmentCache(object):
+    """
+    Opt-in on-disk cache of downloaded segments, shared across runs, courses
+    and feeds (e.g. cross-listed sections or feeds sharing an audio rendition).
+
+    Entries are keyed by the normalised segment url and remember the ETag and
+    length the origin reported. An entry is only used if its data still has
+    that length, and with ``revalidate`` (the default) the ETag is confirmed
+    by a conditional request first. Entries are copies, never hard links, so
+    writing to an output file can't alter the cache or the other way round.
+    Once the cache grows beyond ``max_size`` the
+    least recently used entries are evicted.
+    """
+
+    def __init__(self, root, max_size=DEFAULT_MAX_SIZE, revalidate=True):
+        self.root = root
+        self.max_bytes = parse_size(max_size)
+        self.revalidate = revalidate
+        self._lock = threading.Lock()
+        os.makedirs(self.root, exist_ok=True)
+        self._size = sum(size for _, size, _ in self._entries())
+
+    def _paths(self, url):
+        key = hashlib.sha256(normalise_url(url).encode()).hexdigest()
+        base = os.path.join(self.root, key[:2], key)
+        return base + ".seg", base + ".json"
+
+    def lookup(self, url):
+        """
+        Returns the path of the cached data and its ETag (or None), or
+        ``(None, None)`` on a miss.
+        """
+        data_path, meta_path = self._paths(url)
+        try:
+            with open(meta_path, "r") as f:
+                meta = json.load(f)
+            size = os.path.getsize(data_path)
+            if size != meta["length"]:
+                _LOGGER.debug("Dropping truncated cache entry for %s", url)
+                self._remove(data_path, meta_path)
+                with self._lock:
+                    self._size -= size
+                return None, None
+            # bump for LRU
+            os.utime(data_path, None)
+        except (EnvironmentError, ValueError, KeyError):
+            return None, None
+        return data_path, meta.get("etag")
+
+    def get(self, url):
+        """Cached bytes for ``url`` and its ETag, or ``(None, None)``."""
+        data_path, etag = self.lookup(url)
+        if data_path is None:
+            return None, None
+        try:
+            with open(data_path, "rb") as f:
+                return f.read(), etag
+        except EnvironmentError:
+            return None, None
+
+    def copy_to(self, url, dest):
+        """Copies a cached entry to ``dest``, if there is one."""
+        data_path, _ = self.lookup(url)
+        if data_path is None:
+            return False
+        if os.path.exists(dest):
+            os.remove(dest)
+        # not a hard link: the output is later written to in place (resuming)
+        shutil.copyfile(data_path, dest)
+        return True
+
+    def put(self, url, data, etag=None, length=None):
+        """
+        Stores ``data``. If the origin announced a ``length`` that the data
+        doesn't match, the response was truncated and is not cached.
+        """
+        if length is not None and int(length) != len(data):
+            return
+
+        def write(tmp_path):
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+
+        self._write(url, etag, len(data), write)
+
+    def put_file(self, url, path, etag=None):
+        """Stores a copy of the file at ``path``."""
+
+        def copy(tmp_path):
+            shutil.copyfile(path, tmp_path)
+
+        self._write(url, etag, os.path.getsize(path), copy)
+
+    def _write(self, url, etag, length, produce):
+        data_path, meta_path = self._paths(url)
+        os.makedirs(os.path.dirname(data_path), exist_ok=True)
+        old_size = os.path.getsize(data_path) if os.path.exists(data_path) else 0
+        tmp_path = "{}.{}.tmp".format(data_path, threading.get_ident())
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        produce(tmp_path)
+        os.replace(tmp_path, data_path)
+        with open(tmp_path, "w") as f:
+            json.dump({"etag": etag, "length": length}, f)
+        os.replace(tmp_path, meta_path)
+        with self._lock:
+            self._size += length - old_size
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _entries(self):
+        for dirpath, _, filenames in os.walk(self.root):
+            for name in filenames:
+                if name.endswith(".seg"):
+                    path = os.path.join(dirpath, name)
+                    try:
+                        stat = os.stat(path)
+                    except EnvironmentError:
+                        continue
+                    yield path, stat.st_size, stat.st_mtime
+
+    def _evict(self):
+        # drop the least recently used entries until we are 10% below the cap
+        target = self.max_bytes * 0.9
+        for path, size, _ in sorted(self._entries(), key=lambda e: e[2]):
+            if self._size <= target:
+                break
+            self._remove(path, path[: -len(".seg")] + ".json")
+            self._size -= size
+        _LOGGER.debug("Segment cache evicted down to %d bytes", self._size)
+
+    @staticmethod
+    def _remove(data_path, meta_path):
+        for path in (data_path, meta_path):
+            try:
+                os.remove(path)
+            except EnvironmentError:
+                pass
@@ -0,0 +1,158 @@
+import json
+import logging
+import os
+import time
+
+_LOGGER = logging.getLogger(__name__)
+
+JOURNAL_VERSION = 2
+
+
+def _strip_query(url):
+    # signed urls carry expiring tokens in the query string, which would make a
+    # journal from a previous run never match the current playlist.
+    return url.split("?")[0]
+
+
+class SegmentJournal(object):
+    """
+    Small on-disk record of an in-progress HLS download, stored next to the
+    output file as ``<output>.journal``.
+
+    It records the playlist url, the segment list and how far the output file
+    has been durably written (the first ``written`` segments, ``size`` bytes).
+    The output is fsync'ed before the journal is updated, so after an
+    interruption the next run can truncate the output to ``size`` and fetch
+    only what is missing. The out-of-order segments a failed run held in
+    memory are saved to a single ``<output>.window`` file, ``window`` maps
+    their indices to their offset and size in it.
+    """
+
+    def __init__(self, path, playlist_url, segments, sync_interval=1.0):
+        self.path = path
+        self.window_path = os.path.splitext(path)[0] + ".window"
+        self.playlist_url = playlist_url
+        self.segments = [_strip_query(s) for s in segments]
+        self.written = 0
+        self.size = 0
+        self.window = {}
+        self.complete = False
+        self._sync_interval = sync_interval
+        self._last_sync = 0.0
+
+    @classmethod
+    def load(cls, path, playlist_url, segments):
+        """
+        Returns the journal at ``path`` if it describes the same download,
+        otherwise a fresh journal.
+        """
+        journal = cls(path, playlist_url, segments)
+        if not os.path.exists(path):
+            return journal
+        try:
+            with open(path, "r") as f:
+                data = json.load(f)
+            if (
+                data.get("version") != JOURNAL_VERSION
+                or data.get("segments") != journal.segments
+            ):
+                _LOGGER.debug("Ignoring journal %s for a different playlist", path)
+                # its window holds segments that aren't ours any more
+                return journal.discard()
+            journal.written = int(data["written"])
+            journal.size = int(data["size"])
+            journal.window = {
+                int(index): (int(offset), int(size))
+                for index, (offset, size) in data.get("window", {}).items()
+            }
+            journal.complete = bool(data.get("complete", False))
+        except (ValueError, KeyError, TypeError, EnvironmentError) as e:
+            _LOGGER.debug("Ignoring unreadable journal %s: %s", path, e)
+            return journal.discard()
+        return journal
+
+    def discard(self):
+        """A fresh journal in place of this one, without its saved window."""
+        self._remove_window()
+        return SegmentJournal(self.path, self.playlist_url, self.segments)
+
+    def take_window(self):
+        """
+        The segments (index -> bytes) saved by the previous run that are still
+        missing from the output. They are removed from disk: from now on they
+        are held in memory again.
+        """
+        segments = {}
+        if self.window and os.path.isfile(self.window_path):
+            try:
+                with open(self.window_path, "rb") as f:
+                    for index, (offset, size) in sorted(self.window.items()):
+                        if index < self.written:
+                            continue
+                        f.seek(offset)
+                        data = f.read(size)
+                        if len(data) != size:
+                            break  # truncated, the rest is fetched again
+                        segments[index] = data
+            except EnvironmentError as e:
+                _LOGGER.debug("Ignoring unreadable %s: %s", self.window_path, e)
+        self.window = {}
+        self._remove_window()
+        return segments
+
+    def save_window(self, segments):
+        """Saves the out-of-order ``segments`` (index -> bytes) of a failed run."""
+        window = {}
+        offset = 0
+        with open(self.window_path, "wb") as f:
+            for index, data in sorted(segments.items()):
+                f.write(data)
+                window[index] = (offset, len(data))
+                offset += len(data)
+            f.flush()
+            os.fsync(f.fileno())
+        self.window = window
+        self._save()
+
+    def record(self, written, outfile, force=False):
+        """Persists progress, at most once per ``sync_interval`` unless ``force``."""
+        now = time.monotonic()
+        if not force and now - self._last_sync < self._sync_interval:
+            return
+        self._last_sync = now
+        outfile.flush()
+        os.fsync(outfile.fileno())
+        self.written = written
+        self.size = outfile.tell()
+        self.complete = written >= len(self.segments)
+        self._save()
+
+    def remove(self):
+        self._remove_window()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def _remove_window(self):
+        if os.path.exists(self.window_path):
+            os.remove(self.window_path)
+
+    def _save(self):
+        data = {
+            "version": JOURNAL_VERSION,
+            "playlist_url": self.playlist_url,
+            "segments": self.segments,
+            "written": self.written,
+            "size": self.size,
+            "window": {
+                str(index): [offset, size]
+                for index, (offset, size) in self.window.items()
+            },
+            "complete": self.complete,
+        }
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(data, f)
+            f.flush()
+            os.fsync(f.fileno())
+        # atomic, so a crash never leaves a half-written journal behind
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,74 @@
+import logging
+import threading
+import time
+
+import requests
+import requests.adapters
+
+from .retry import connection_retries
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class SessionManager(object):
+    """
+    One HTTP session for a whole run, handed to every downloader so that
+    keep-alive connections (and their TLS handshakes) are reused across all
+    lectures instead of starting from a cold pool for each file.
+
+    The session carries a snapshot of the webdriver's cookies. Reading them is
+    a WebDriver round-trip, so the snapshot is only re-read once it is older
+    than ``cookie_ttl`` seconds (or after ``invalidate``), and the session's
+    cookie jar is only touched when the cookies actually changed.
+    """
+
+    def __init__(
+        self,
+        driver,
+        pool_connections=10,
+        pool_maxsize=50,
+        max_retries=3,
+        cookie_ttl=300,
+    ):
+        self._driver = driver
+        self._cookie_ttl = cookie_ttl
+        self._cookie_fingerprint = None
+        self._cookies_read_at = None
+        self._lock = threading.Lock()
+        self._session = requests.Session()
+        # one pool per host, big enough to keep every in-flight request alive
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=pool_connections,
+            pool_maxsize=pool_maxsize,
+            max_retries=connection_retries(max_retries),
+        )
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+
+    @property
+    def session(self):
+        self.refresh_cookies()
+        return self._session
+
+    def invalidate(self):
+        """Re-read the cookies on next use, e.g. after the browser logged in."""
+        self._cookies_read_at = None
+
+    def refresh_cookies(self, force=False):
+        with self._lock:
+            if (
+                not force
+                and self._cookies_read_at is not None
+                and time.monotonic() - self._cookies_read_at < self._cookie_ttl
+            ):
+                return
+            cookies = self._driver.get_cookies()
+            self._cookies_read_at = time.monotonic()
+            fingerprint = sorted((c["name"], c["value"]) for c in cookies)
+            if fingerprint == self._cookie_fingerprint:
+                return
+            _LOGGER.debug("Webdriver cookies changed, updating the shared session")
+            self._cookie_fingerprint = fingerprint
+            self._session.cookies.clear()
+            for cookie in cookies:
+                self._session.cookies.set(cookie["name"], cookie["value"])
@@ -0,0 +1,141 @@
+"""
+Streaming of response bodies through reusable buffers.
+
+``iter_content`` allocates a new bytes object for every chunk (and urllib3's
+``readinto`` merely copies one). Where the body needs no decoding, the
+helpers here ``readinto`` preallocated buffers straight from the underlying
+``http.client`` response and hand out ``memoryview`` slices of them, so a
+multi-GB download reuses the same few buffers throughout.
+"""
+import collections
+import threading
+
+from .utils import parse_size
+
+DEFAULT_CHUNK_SIZE = 256 * 1024
+
+
+class BufferPool(object):
+    """Preallocated ``bytearray`` buffers of ``chunk_size`` bytes, reused."""
+
+    def __init__(self, chunk_size=DEFAULT_CHUNK_SIZE, max_buffers=64):
+        self.chunk_size = int(parse_size(chunk_size))
+        self.max_buffers = max_buffers
+        self._free = collections.deque()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            if self._free:
+                return self._free.pop()
+        return bytearray(self.chunk_size)
+
+    def release(self, buf):
+        with self._lock:
+            if len(self._free) < self.max_buffers:
+                self._free.append(buf)
+
+
+_POOLS = {}
+_POOLS_LOCK = threading.Lock()
+
+
+def get_buffer_pool(chunk_size=DEFAULT_CHUNK_SIZE):
+    """The process-wide pool for buffers of ``chunk_size``."""
+    chunk_size = int(parse_size(chunk_size))
+    with _POOLS_LOCK:
+        if chunk_size not in _POOLS:
+            _POOLS[chunk_size] = BufferPool(chunk_size)
+        return _POOLS[chunk_size]
+
+
+def _raw_readinto(r):
+    """
+    ``readinto`` of the ``http.client`` response below a requests response,
+    or None when the body has to go through urllib3 (e.g. to be decoded) or
+    the response isn't a requests one (the asyncio backend's).
+    """
+    encoding = r.headers.get("content-encoding", "identity").lower()
+    if encoding not in ("", "identity"):
+        return None
+    fp = getattr(getattr(r, "raw", None), "_fp", None)
+    return getattr(fp, "readinto", None)
+
+
+def _release(r):
+    # http.client closed its side at the end of the body; give the (still
+    # open) connection back to the pool, as urllib3 would have
+    raw = r.raw
+    original = getattr(raw, "_original_response", None)
+    if original is None or original.isclosed():
+        raw.release_conn()
+
+
+def iter_body(r, pool):
+    """
+    Yields the body of ``r`` as memoryviews of a pooled buffer. A view is only
+    valid until the next one is requested.
+    """
+    readinto = _raw_readinto(r)
+    if readinto is None:
+        for data in r.iter_content(pool.chunk_size):
+            yield memoryview(data)
+        return
+    buf = pool.acquire()
+    try:
+        view = memoryview(buf)
+        while True:
+            n = readinto(view)
+            if not n:
+                break
+            yield view[:n]
+        _release(r)
+    finally:
+        pool.release(buf)
+
+
+def read_body(r, pool, on_chunk=None):
+    """
+    Reads the whole body of ``r``. When the length is known it is read into a
+    single exactly sized buffer, without any intermediate chunk objects.
+    ``on_chunk(nbytes)`` is called for every chunk read (e.g. for throttling).
+    """
+    length = r.headers.get("content-length")
+    readinto = _raw_readinto(r)
+    if readinto is None or length is None:
+        chunks = []
+        for chunk in iter_body(r, pool):
+            if on_chunk is not None:
+                on_chunk(len(chunk))
+            chunks.append(bytes(chunk))
+        return b"".join(chunks)
+    body = bytearray(int(length))
+    view = memoryview(body)
+    got = 0
+    while got < len(body):
+        n = readinto(view[got : got + pool.chunk_size])
+        if not n:
+            break
+        if on_chunk is not None:
+            on_chunk(n)
+        got += n
+    if got < len(body):
+        raise IOError(
+            "Connection closed after {} of {} bytes".format(got, len(body))
+        )
+    _release(r)
+    return body
+
+
+def write_body(r, f, pool, on_chunk=None):
+    """
+    Streams the body of ``r`` into the file ``f``, returns the bytes written.
+    ``on_chunk(nbytes)`` is called after each chunk was written.
+    """
+    written = 0
+    for chunk in iter_body(r, pool):
+        f.write(chunk)
+        written += len(chunk)
+        if on_chunk is not None:
+            on_chunk(len(chunk))
+    return written
@@ -0,0 +1,32 @@
+import re
+
+_SIZE_RE = re.compile(r"^\s*(\d+(?:\.\d+)?)\s*([kmgt]?)(?:i?b(?:/s)?)?\s*$", re.I)
+_UNITS = {"": 1, "k": 1000, "m": 1000 ** 2, "g": 1000 ** 3, "t": 1000 ** 4}
+
+
+def parse_size(size):
+    """
+    Parses a human readable number of bytes with an optional K/M/G/T suffix
+    (powers of 1000), e.g. '20M' -> 20000000. Numbers are returned as is.
+    """
+    if isinstance(size, (int, float)):
+        return float(size)
+    match = _SIZE_RE.match(size)
+    if match is None:
+        raise ValueError("Invalid size {!r} (e.g. 500K, 20M, 10G)".format(size))
+    return float(match.group(1)) * _UNITS[match.group(2).lower()]
+
+
+def format_size(nbytes):
+    """The inverse of ``parse_size`` for display, e.g. 1234567 -> '1.2 MB'."""
+    for unit in ("B", "KB", "MB", "GB"):
+        if abs(nbytes) < 1000:
+            return "{:.1f} {}".format(nbytes, unit)
+        nbytes /= 1000.0
+    return "{:.1f} TB".format(nbytes)
+
+
+def format_duration(seconds):
+    """Seconds as H:MM:SS."""
+    seconds = int(round(seconds))
+    return "{}:{:02d}:{:02d}".format(seconds // 3600, seconds // 60 % 60, seconds % 60)
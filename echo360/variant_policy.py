@@ -0,0 +1,160 @@
+"""
+Choice of the variant (quality) of a lecture to download.
+
+By default the highest quality is downloaded. A cap such as
+``max_resolution="720p"`` keeps the archive at 720p even when 1080p is
+offered (which costs about twice the bytes), ``variant="lowest"`` with
+``min_bandwidth="800K"`` picks the smallest variant above 800 kbit/s.
+"""
+import logging
+import re
+
+from .progress import get_progress
+from .utils import parse_size
+
+_LOGGER = logging.getLogger(__name__)
+
+HIGHEST = "highest"
+LOWEST = "lowest"
+
+# codec prefixes of audio formats, any other codec is taken to be video
+_AUDIO_CODECS = ("mp4a", "ac-3", "ec-3", "opus", "flac", "alac", "mp3")
+
+_RESOLUTION_RE = re.compile(r"^\s*(?:(\d+)\s*x\s*)?(\d+)\s*p?\s*$", re.I)
+
+
+def parse_resolution(resolution):
+    """'720p' or '1280x720' -> the height, 720."""
+    if resolution is None or isinstance(resolution, int):
+        return resolution
+    match = _RESOLUTION_RE.match(str(resolution))
+    if match is None:
+        raise ValueError(
+            "Invalid resolution {!r} (e.g. 720p, 1280x720)".format(resolution)
+        )
+    return int(match.group(2))
+
+
+def is_audio_codec(codec):
+    return codec.lower().startswith(_AUDIO_CODECS)
+
+
+def describe(variant):
+    """``variant`` for messages, e.g. '1280x720, 2.0 Mbps, avc1.640029'."""
+    parts = []
+    if variant.resolution is not None:
+        parts.append("{}x{}".format(*variant.resolution))
+    if variant.bandwidth:
+        parts.append("{:.1f} Mbps".format(variant.bandwidth / 1e6))
+    if variant.codecs:
+        parts.append(",".join(variant.codecs))
+    return ", ".join(parts) or "unknown quality"
+
+
+class VariantPolicy(object):
+    """
+    Selects a variant of a master playlist. Of the variants within
+    ``max_resolution`` (a height), ``min_bandwidth``/``max_bandwidth`` (in
+    bit/s as in the playlist, e.g. "800K") and using only ``codecs`` (prefixes
+    such as "avc1,mp4a"), the ``highest`` or ``lowest`` quality one is picked.
+    ``codecs`` only constrains the kinds (video, audio) it names, so "avc1"
+    keeps muxed avc1/mp4a variants. When none qualifies, the one closest to
+    the limits is.
+    """
+
+    def __init__(
+        self,
+        prefer=HIGHEST,
+        max_resolution=None,
+        min_bandwidth=None,
+        max_bandwidth=None,
+        codecs=None,
+    ):
+        if prefer not in (HIGHEST, LOWEST):
+            raise ValueError(
+                "Invalid variant preference {!r}, expected {} or {}".format(
+                    prefer, HIGHEST, LOWEST
+                )
+            )
+        self.prefer = prefer
+        self.max_height = parse_resolution(max_resolution)
+        self.min_bandwidth = parse_size(min_bandwidth) if min_bandwidth else None
+        self.max_bandwidth = parse_size(max_bandwidth) if max_bandwidth else None
+        if isinstance(codecs, str):
+            codecs = codecs.split(",")
+        self.codecs = tuple(c.strip() for c in codecs or () if c.strip())
+        self._audio_codecs = tuple(c for c in self.codecs if is_audio_codec(c))
+        self._video_codecs = tuple(c for c in self.codecs if not is_audio_codec(c))
+
+    def select(self, master):
+        """The variant of ``master`` to download, None if it has none."""
+        candidates = master.video_variants or master.variants
+        if not candidates:
+            return None
+        # ties go to the variant listed last, as they always have (e.g. for
+        # variants without any attributes)
+        position = {id(v): i for i, v in enumerate(candidates)}
+        suitable = [v for v in candidates if self._suitable(v)]
+        if suitable:
+            if self.prefer == HIGHEST:
+                variant = max(
+                    suitable, key=lambda v: (self._quality(v), position[id(v)])
+                )
+            else:
+                variant = min(
+                    suitable,
+                    key=lambda v: (v.bandwidth, self._quality(v), -position[id(v)]),
+                )
+        else:
+            # nothing within the limits: stay as close to them as possible
+            variant = self._closest(candidates, position)
+            # whole lines only, downloads may be drawing progress below
+            get_progress().message(
+                "[WARN] No variant of {} matches the quality limits, using {}".format(
+                    master.url, describe(variant)
+                )
+            )
+        _LOGGER.debug(
+            "Selected variant %s (%s) of %d in %s",
+            variant.uri,
+            describe(variant),
+            len(candidates),
+            master.url,
+        )
+        return variant
+
+    def _suitable(self, variant):
+        if self.max_height is not None and variant.resolution is not None:
+            if variant.resolution[1] > self.max_height:
+                return False
+        # a variant without a BANDWIDTH (nested playlists) isn't known to be
+        # within bandwidth limits
+        if self.min_bandwidth is not None:
+            if not variant.bandwidth or variant.bandwidth < self.min_bandwidth:
+                return False
+        if self.max_bandwidth is not None:
+            if not variant.bandwidth or variant.bandwidth > self.max_bandwidth:
+                return False
+        for codec in variant.codecs or ():
+            allowed = (
+                self._audio_codecs if is_audio_codec(codec) else self._video_codecs
+            )
+            if allowed and not codec.startswith(allowed):
+                return False
+        return True
+
+    @staticmethod
+    def _quality(variant):
+        height = variant.resolution[1] if variant.resolution is not None else 0
+        return (height, variant.bandwidth)
+
+    def _closest(self, candidates, position):
+        # a cap exceeded by all: pick the least. Otherwise (a minimum not met,
+        # codecs not offered) the lesser evil is the best there is
+        capped = self.max_height is not None or self.max_bandwidth is not None
+        if not capped or (
+            self.min_bandwidth is not None
+            and all(v.bandwidth < self.min_bandwidth for v in candidates)
+        ):
+            return max(candidates, key=lambda v: (self._quality(v), position[id(v)]))
+        return min(candidates, key=lambda v: (self._quality(v), -position[id(v)]))
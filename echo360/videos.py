@@ -4,7 +4,7 @@ import re
 import dateutil.parser
 import operator
 import sys
-import tqdm
+from concurrent.futures import ThreadPoolExecutor
 
 from urllib.parse import urlparse
 import ffmpy
@@ -19,8 +19,17 @@ from selenium.webdriver.support import expected_conditions as EC
 from selenium.common.exceptions import StaleElementReferenceException
 from selenium.webdriver.remote.webdriver import WebDriver
 
+from .echo_exceptions import HlsDownloaderError
 from .hls_downloader import Downloader
-from .naive_m3u8_parser import NaiveM3U8Parser
+from .concurrency import AIMDController, DEFAULT_MIN_CONCURRENCY
+from .http_cache import get_http_cache
+from .metrics import get_metrics
+from .progress import get_progress
+from .ranged_downloader import RangedDownloader
+from .remux import MUX_AUTO, audio_options
+from .streaming import DEFAULT_CHUNK_SIZE
+from . import m3u8
+from .variant_policy import VariantPolicy, describe
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -33,6 +42,14 @@ def update_course_retrieval_progress(current, total):
     sys.stdout.flush()
 
 
+def _print_header(filename):
+    # through the progress display, lectures may be downloading side by side
+    progress = get_progress()
+    progress.message("")
+    progress.message("-" * 60)
+    progress.message('Downloading "{}"'.format(filename))
+
+
 class EchoVideos(object):
     def __init__(self, videos_json, driver):
         assert videos_json is not None
@@ -61,18 +78,12 @@ class EchoVideo(object):
     def __init__(self, video_json:dict, driver:WebDriver ):
         self._driver = driver
 
+        # the stream url is only looked up (a page load) once it's needed
+        self._url = None
+
         try:
             video_url = "{0}".format(video_json["richMedia"])
-            video_url = str(video_url)  # cast back to string
-
-            self._driver.get(video_url)
-            _LOGGER.debug(
-                "Dumping video page at %s: %s", video_url, self._driver.page_source
-            )
-
-            m3u8_url = self._loop_find_m3u8_url(video_url, waitsecond=30)
-            _LOGGER.debug("Found the following urls %s", m3u8_url)
-            self._url = m3u8_url
+            self.video_url = str(video_url)  # cast back to string
 
             self._date = self.get_date(video_json["startTime"])
             self._title = video_json["title"]
@@ -122,8 +133,17 @@ class EchoVideo(object):
 
     @property
     def url(self):
+        """The stream url, found on the lecture page on first use."""
+        if self._url is None:
+            self._url = self._resolve_url()
         return self._url
 
+    def _resolve_url(self):
+        # loads the page itself
+        m3u8_url = self._loop_find_m3u8_url(self.video_url, waitsecond=30)
+        _LOGGER.debug("Found the following urls %s", m3u8_url)
+        return m3u8_url
+
     @property
     def title(self):
         if type(self._title) != str:
@@ -148,21 +168,41 @@ class EchoVideo(object):
         print("Exception: {}".format(str(e)))
         sys.exit(1)
 
-    def download(self, output_dir, filename, pool_size=50):
-        print("")
-        print("-" * 60)
-        print('Downloading "{}"'.format(filename))
-        self._download_url_to_dir(self.url, output_dir, filename, pool_size)
-        print("-" * 60)
+    def download(
+        self, output_dir, filename, pool_size=50, mux_mode=MUX_AUTO, **downloader_kwargs
+    ):
+        # mux_mode only matters for separate audio/video, which echo360 doesn't serve
+        progress = get_progress()
+        _print_header(filename)
+        try:
+            self._download_url_to_dir(
+                self.url, output_dir, filename, pool_size, **downloader_kwargs
+            )
+        except HlsDownloaderError as e:
+            progress.message("ERROR: {}. Skipping {}".format(e, filename))
+            progress.message("-" * 60)
+            return False
+        progress.message("-" * 60)
         return True
 
     def _download_url_to_dir(
-        self, url, output_dir, filename, pool_size, convert_to_mp4=True
+        self,
+        url,
+        output_dir,
+        filename,
+        pool_size,
+        convert_to_mp4=True,
+        **downloader_kwargs
     ):
-        echo360_downloader = Downloader(
-            pool_size, selenium_cookies=self._driver.get_cookies()
+        if (
+            downloader_kwargs.get("session_manager") is None
+            and "selenium_cookies" not in downloader_kwargs
+        ):
+            downloader_kwargs["selenium_cookies"] = self._driver.get_cookies()
+        echo360_downloader = Downloader(pool_size, **downloader_kwargs)
+        echo360_downloader.run(
+            url, output_dir, convert_to_mp4=convert_to_mp4, name=filename
         )
-        echo360_downloader.run(url, output_dir, convert_to_mp4=convert_to_mp4)
 
         # rename file
         ext = echo360_downloader.result_file_name.split(".")[-1]
@@ -170,19 +210,14 @@ class EchoVideo(object):
         os.rename(os.path.join(echo360_downloader.result_file_name), result_full_path)
         return result_full_path
 
-    def _download_url_to_dir_request(self, session, url, output_dir, filename):
+    def _download_url_to_dir_request(
+        self, session, url, output_dir, filename, chunk_size=DEFAULT_CHUNK_SIZE
+    ):
         ext = url.split(".")[-1]
-
-        r = session.get(url, stream=True)
-        total_size = int(r.headers.get("content-length", 0))
-        block_size = 1024  # 1 kilobyte
         result_full_path = os.path.join(output_dir, filename + ext)
-        with tqdm.tqdm(total=total_size, unit="iB", unit_scale=True) as pbar:
-            with open(result_full_path, "wb") as f:
-                for data in r.iter_content(block_size):
-                    pbar.update(len(data))
-                    f.write(data)
-        return result_full_path
+        return RangedDownloader(session, chunk_size=chunk_size).download(
+            url, result_full_path
+        )
 
     def get_all_parts(self):
         return [self]
@@ -229,6 +264,7 @@ class EchoCloudVideo(EchoVideo):
         self.is_multipart_video = False
         self.sub_videos = [self]
         self.download_alternative_feeds = alternative_feeds
+        self._url = None
         if "lessons" in video_json:
             # IS a multi-part lesson.
             self.sub_videos = [
@@ -250,29 +286,26 @@ class EchoCloudVideo(EchoVideo):
         video_id = "{0}".format(video_json["lesson"]["lesson"]["id"])
         self.video_id = str(video_id)  # cast back to string
 
-        self._driver.get(self.video_url)
-        _LOGGER.debug(
-            "Dumping video page at %s: %s", self.video_url, self._driver.page_source
-        )
-
-        m3u8_url = self._loop_find_m3u8_url(self.video_url, waitsecond=30)
-        _LOGGER.debug("Found the following urls %s", m3u8_url)
-        self._url = m3u8_url
-
         self._date = self.get_date(video_json)
         self._title = video_json["lesson"]["lesson"]["name"]
 
-    def download(self, output_dir, filename, pool_size=50):
-        print("")
-        print("-" * 60)
-        print('Downloading "{}"'.format(filename))
+    def download(
+        self, output_dir, filename, pool_size=50, mux_mode=MUX_AUTO, **downloader_kwargs
+    ):
+        _print_header(filename)
         if not os.path.exists(output_dir):
             os.makedirs(output_dir)
 
-        session = requests.Session()
-        # load cookies
-        for cookie in self._driver.get_cookies():
-            session.cookies.set(cookie["name"], cookie["value"])
+        session_manager = downloader_kwargs.get("session_manager")
+        if session_manager is not None:
+            session = session_manager.session
+        else:
+            session = requests.Session()
+            # load cookies, once: the webdriver is not thread-safe
+            cookies = self._driver.get_cookies()
+            for cookie in cookies:
+                session.cookies.set(cookie["name"], cookie["value"])
+            downloader_kwargs.setdefault("selenium_cookies", cookies)
 
         urls = self.url
         if not isinstance(urls, list):
@@ -282,79 +315,141 @@ class EchoCloudVideo(EchoVideo):
             # download_alternative_feeds defaults to False, slice to include only the first one
             urls = urls[:1]
 
-        final_result = True
-        for counter, single_url in enumerate(urls):
+        if len(urls) > 1 and downloader_kwargs.get("controller") is None:
+            # the feeds share one concurrency budget
+            downloader_kwargs["controller"] = AIMDController(
+                floor=downloader_kwargs.get("min_pool_size", DEFAULT_MIN_CONCURRENCY),
+                ceiling=pool_size,
+            )
+
+        def download_feed(counter, single_url):
             if self.download_alternative_feeds:
-                print("- Downloading video feed {}...".format(counter + 1))
+                get_progress().message(
+                    "- Downloading video feed {} of {}...".format(counter + 1, filename)
+                )
             new_filename = (
                 (filename + str(counter + 1))
                 if self.download_alternative_feeds
                 else filename
             )
-            result = self.download_single(
-                session, single_url, output_dir, new_filename, pool_size
-            )
-            final_result = final_result and result
-
-        return final_result
+            try:
+                return self.download_single(
+                    session,
+                    single_url,
+                    output_dir,
+                    new_filename,
+                    pool_size,
+                    mux_mode=mux_mode,
+                    **downloader_kwargs
+                )
+            except (HlsDownloaderError, requests.RequestException) as e:
+                get_progress().message(
+                    "ERROR: {}. Skipping {}".format(e, new_filename)
+                )
+                return False
 
-    def download_single(self, session, single_url, output_dir, filename, pool_size):
+        if len(urls) == 1:
+            return download_feed(0, urls[0])
+        # the feeds (e.g. camera and screen) are independent, fetch them side by side
+        with ThreadPoolExecutor(max_workers=len(urls)) as executor:
+            results = list(executor.map(download_feed, range(len(urls)), urls))
+        return all(results)
+
+    def download_single(
+        self,
+        session,
+        single_url,
+        output_dir,
+        filename,
+        pool_size,
+        mux_mode=MUX_AUTO,
+        **downloader_kwargs
+    ):
         if single_url.endswith(".m3u8"):
-            r = session.get(single_url)
-            if not r.ok:
-                print("Error: Failed to get m3u8 info. Skipping this video")
+            r, body = get_http_cache().get(session, single_url)
+            if body is None:
+                get_progress().message(
+                    "Error: Failed to get m3u8 info of {}. Skipping this video".format(
+                        filename
+                    )
+                )
                 return False
 
-            lines = [n for n in r.content.decode().split("\n")]
-            m3u8_video = None
-            m3u8_audio = None
-
-            _LOGGER.debug("Searching for m3u8 with content {}".format(lines))
-
-            m3u8_parser = NaiveM3U8Parser(lines)
+            _LOGGER.debug("Searching for m3u8 with content %s", body)
             try:
-                m3u8_parser.parse()
-            except Exception as e:
-                _LOGGER.debug("Exception occurred while parsing m3u8: {}".format(e))
-                print("Failed to parse m3u8. Skipping...")
+                playlist = m3u8.parse(body, single_url)
+            except m3u8.M3U8Error as e:
+                _LOGGER.debug("Exception occurred while parsing m3u8: %s", e)
+                get_progress().message(
+                    "Failed to parse m3u8 of {}. Skipping...".format(filename)
+                )
                 return False
 
-            m3u8_video, m3u8_audio = m3u8_parser.get_video_and_audio()
-
-            if (
-                m3u8_video is None
-            ):  # even if audio is None it's okay, maybe audio is include with video
-                print("ERROR: Failed to find video m3u8... skipping this one")
-                return False
+            if isinstance(playlist, m3u8.MediaPlaylist):
+                # no variants, the playlist is the video (with its audio) itself
+                renditions = {"video": single_url}
+                quality = ""
+            else:
+                policy = downloader_kwargs.get("variant_policy") or VariantPolicy()
+                variant = policy.select(playlist)
+                if variant is None:
+                    get_progress().message(
+                        "ERROR: Failed to find video m3u8 of {}... skipping this "
+                        "one".format(filename)
+                    )
+                    return False
+                renditions = {"video": variant.uri}
+                quality = " ({})".format(describe(variant))
+                # even if audio is None it's okay, maybe audio is include with video
+                audio = playlist.audio_for(variant)
+                if audio is not None:
+                    renditions["audio"] = audio
             # NOW we can finally start downloading!
-            from .hls_downloader import urljoin
-
-            audio_file = None
-            if m3u8_audio is not None:
-                print("  > Downloading audio:")
-                audio_file = self._download_url_to_dir(
-                    urljoin(single_url, m3u8_audio),
-                    output_dir,
-                    filename + "_audio",
-                    pool_size,
-                    convert_to_mp4=False,
+            # whole lines through the progress display, feeds may run side by side
+            get_progress().message(
+                "  > Downloading {} of {}{}:".format(
+                    " and ".join(sorted(renditions)), filename, quality
                 )
-            print("  > Downloading video:")
-            video_file = self._download_url_to_dir(
-                urljoin(single_url, m3u8_video),
-                output_dir,
-                filename + "_video",
-                pool_size,
-                convert_to_mp4=False,
             )
-            sys.stdout.write("  > Converting to mp4... ")
-            sys.stdout.flush()
+            # the renditions are independent streams, fetch them side by side
+            # within one concurrency budget
+            if downloader_kwargs.get("controller") is None:
+                downloader_kwargs["controller"] = AIMDController(
+                    floor=downloader_kwargs.get(
+                        "min_pool_size", DEFAULT_MIN_CONCURRENCY
+                    ),
+                    ceiling=pool_size,
+                )
+            if (
+                downloader_kwargs.get("session_manager") is None
+                and "selenium_cookies" not in downloader_kwargs
+            ):
+                # read once here, the webdriver is not thread-safe
+                downloader_kwargs["selenium_cookies"] = self._driver.get_cookies()
+            with ThreadPoolExecutor(max_workers=len(renditions)) as executor:
+                futures = {
+                    kind: executor.submit(
+                        self._download_url_to_dir,
+                        m3u8_url,
+                        output_dir,
+                        "{}_{}".format(filename, kind),
+                        pool_size,
+                        convert_to_mp4=False,
+                        **downloader_kwargs
+                    )
+                    for kind, m3u8_url in renditions.items()
+                }
+            # muxing starts once both are done (raises if either failed)
+            video_file = futures["video"].result()
+            audio_file = futures["audio"].result() if "audio" in futures else None
+            get_progress().message("  > Converting {} to mp4...".format(filename))
 
             # combine audio file with video (separate audio might not exists.)
             if self.combine_audio_video(
                 audio_file=audio_file,
                 video_file=video_file,
                 final_file=os.path.join(output_dir, filename + ".mp4"),
+                mux_mode=mux_mode,
             ):
                 # remove left-over plain audio/video files. (if mixing was successful)
                 if audio_file is not None:
@@ -362,172 +457,186 @@ class EchoCloudVideo(EchoVideo):
                 os.remove(video_file)
 
         else:  # ends with mp4
-            import tqdm
-
-            r = session.get(single_url, stream=True)
-            total_size = int(r.headers.get("content-length", 0))
-            block_size = 1024  # 1 kilobyte
-            with tqdm.tqdm(total=total_size, unit="iB", unit_scale=True) as pbar:
-                with open(os.path.join(output_dir, filename + ".mp4"), "wb") as f:
-                    for data in r.iter_content(block_size):
-                        pbar.update(len(data))
-                        f.write(data)
-
-        print("Done!")
-        print("-" * 60)
+            RangedDownloader(
+                session,
+                retry_policy=downloader_kwargs.get("retry_policy"),
+                chunk_size=downloader_kwargs.get("chunk_size", DEFAULT_CHUNK_SIZE),
+            ).download(single_url, os.path.join(output_dir, filename + ".mp4"))
+
+        get_progress().message("  > {} Done!".format(filename))
+        get_progress().message("-" * 60)
         return True
 
     @staticmethod
-    def combine_audio_video(audio_file, video_file, final_file):
+    def combine_audio_video(audio_file, video_file, final_file, mux_mode=MUX_AUTO):
         if os.path.exists(final_file):
             os.remove(final_file)
         _inputs = {}
         _inputs[video_file] = None
         if audio_file is not None:
             _inputs[audio_file] = None
+        audio = audio_options(list(_inputs), mux_mode)
+        if audio is not None:
+            attempts = [audio]
+        else:
+            # couldn't probe the codecs: try copying, re-encode if ffmpeg refuses
+            attempts = [["-c:a", "copy"], ["-c:a", "ac3"]]
         try:
-            ff = ffmpy.FFmpeg(
-                global_options="-loglevel panic",
-                inputs=_inputs,
-                outputs={final_file: ["-c:v", "copy", "-c:a", "ac3"]},
-            )
-            ff.run()
+            for attempt, options in enumerate(attempts, 1):
+                ff = ffmpy.FFmpeg(
+                    global_options="-loglevel panic",
+                    inputs=_inputs,
+                    outputs={final_file: ["-c:v", "copy"] + options},
+                )
+                try:
+                    with get_metrics().timer("ffmpeg"):
+                        ff.run()
+                    break
+                except ffmpy.FFRuntimeError:
+                    if attempt == len(attempts):
+                        raise
+                    _LOGGER.debug("Copying the audio failed, re-encoding it")
+                    if os.path.exists(final_file):
+                        os.remove(final_file)
         except ffmpy.FFExecutableNotFoundError:
-            print(
+            get_progress().message(
                 '[WARN] Skipping mixing of audio/video because "ffmpeg" not installed.'
             )
             return False
         except ffmpy.FFRuntimeError:
-            print(
-                "[Error] Skipping mixing of audio/video because ffmpeg exited with non-zero status code."
+            get_progress().message(
+                "[Error] Skipping mixing of audio/video of {} because ffmpeg exited "
+                "with non-zero status code.".format(final_file)
             )
             return False
         return True
 
-    def _loop_find_m3u8_url(self, video_url, waitsecond=15, max_attempts=5):
-        def brute_force_get_url(suffix):
-            # this is the first method I tried, which sort of works
-            stale_attempt = 1
-            refresh_attempt = 1
-            while True:
-                self._driver.get(video_url)
-                try:
-                    # the replace is for reversing the escape by the escapped js in the page source
-                    urls = set(
-                        re.findall(
-                            'https://[^,"]*?[.]{}'.format(suffix),
-                            self._driver.page_source.replace("\/", "/"),
-                        )
-                    )
-                    return urls
-
-                except selenium.common.exceptions.TimeoutException:
-                    if refresh_attempt >= max_attempts:
-                        print(
-                            "\r\nERROR: Connection timeouted after {} second for {} attempts... \
-                              Possibly internet problem?".format(
-                                waitsecond, max_attempts
-                            )
-                        )
-                        raise
-                    refresh_attempt += 1
-                except StaleElementReferenceException:
-                    if stale_attempt >= max_attempts:
-                        print(
-                            "\r\nERROR: Elements are not stable to retrieve after {} attempts... \
-                            Possibly internet problem?".format(
-                                max_attempts
-                            )
-                        )
-                        raise
-                    stale_attempt += 1
-
-        def brute_force_get_mp4_url():
-            """Forcefully try to find all .mp4 url in the page source"""
-            urls = brute_force_get_url(suffix="mp4")
-            if len(urls) == 0:
-                raise Exception("None were found.")
-            # in many cases, there would be urls in the format of http://xxx.{hd1,hd2,sd1,sd2}
-            # I'm not sure what does the 1 and 2 in hd1,hd2 stands for, but hd and sd should means
-            # high or low definition.
-            # Some university uses hd1 and hd2 for their alternative feeds, use flag `-a`
-            # to download both feeds.
-            # Let's prioritise hd over sd, and 1 over 2 (the latter is arbitary)
-            # which happens to be the natual order of letter anyway, so we can simply use sorted.
-            return sorted(urls)[:2]
-
-        def from_json_m3u8():
-            # seems like json would also contain that information so this method tries
-            # to retrieve based on that
-            if (
-                not self.video_json["lesson"]["hasVideo"]
-                or not self.video_json["lesson"]["hasAvailableVideo"]
-            ):
-                return False
+    def _resolve_url(self):
+        """
+        Tries the strategies in order: first the ones reading ``video_json``
+        (no browser involved), then the ones searching the lecture page, which
+        is loaded once and only if none of the former found the video.
+        """
+        for strategy in (self._url_from_json_mp4, self._url_from_json_m3u8):
+            _LOGGER.debug("Trying %s method", strategy.__name__)
+            try:
+                url = strategy()
+            except (KeyError, IndexError, TypeError, ValueError) as e:
+                _LOGGER.debug("Encountered exception: %r", e)
+                continue
+            _LOGGER.debug("Found the following urls %s", url)
+            return url
+
+        page_source = self._load_page_source(self.video_url)
+        for strategy in (self._url_from_page_mp4, self._url_from_page_m3u8):
+            _LOGGER.debug("Trying %s method", strategy.__name__)
+            try:
+                url = strategy(page_source)
+            except ValueError as e:
+                _LOGGER.debug("Encountered exception: %r", e)
+                continue
+            _LOGGER.debug("Found the following urls %s", url)
+            return url
+        _LOGGER.debug("All methods had been exhausted.")
+        print(
+            "No audio+video m3u8 files found! Skipping...\n"
+            "This can either be (i) Credential failure? (ii) Logic error "
+            "in the script. (iii) This lecture only provides audio?\n"
+            "This script is hard-coded to download audio+video. "
+            "If this is your intended behaviour, "
+            "please contact the author."
+        )
+        return False
+
+    def _url_from_json_mp4(self):
+        mp4_files = self.video_json["lesson"]["video"]["media"]["media"]["current"][
+            "primaryFiles"
+        ]
+        urls = [obj["s3Url"] for obj in mp4_files]
+        if len(urls) == 0:
+            raise ValueError("Cannot find mp4 urls")
+        # usually hd is the last one. so we will sort in reverse order
+        return next(reversed(urls))
+
+    def _url_from_json_m3u8(self):
+        # seems like json would also contain that information so this method tries
+        # to retrieve based on that
+        if (
+            not self.video_json["lesson"]["hasVideo"]
+            or not self.video_json["lesson"]["hasAvailableVideo"]
+        ):
+            return False
 
-            manifests = self.video_json["lesson"]["video"]["media"]["media"][
-                "versions"
-            ][0]["manifests"]
-            m3u8urls = [m["uri"] for m in manifests]
-            # somehow the hostname for these urls are from amazon (probably offloading
-            # to them.) We need to set the host back to echo360.org
-            new_m3u8urls = []
-            new_hostname = urlparse(self.hostname).netloc
-            for url in m3u8urls:
-                parse_result = urlparse(url)
-                new_m3u8urls.append(
-                    f"{parse_result.scheme}://content.{new_hostname}{parse_result.path}"
+        manifests = self.video_json["lesson"]["video"]["media"]["media"]["versions"][
+            0
+        ]["manifests"]
+        # somehow the hostname for these urls are from amazon (probably offloading
+        # to them.) We need to set the host back to echo360.org
+        new_hostname = urlparse(self.hostname).netloc
+        m3u8urls = []
+        for manifest in manifests:
+            parse_result = urlparse(manifest["uri"])
+            m3u8urls.append(
+                f"{parse_result.scheme}://content.{new_hostname}{parse_result.path}"
+            )
+        return self._select_m3u8_urls(m3u8urls)
+
+    def _load_page_source(self, video_url, max_attempts=5):
+        stale_attempt = 1
+        refresh_attempt = 1
+        while True:
+            try:
+                self._driver.get(video_url)
+                _LOGGER.debug(
+                    "Dumping video page at %s: %s", video_url, self._driver.page_source
                 )
-            return new_m3u8urls
+                # the replace is for reversing the escape by the escapped js in the
+                # page source
+                return self._driver.page_source.replace("\\/", "/")
+            except selenium.common.exceptions.TimeoutException:
+                if refresh_attempt >= max_attempts:
+                    print(
+                        "\r\nERROR: Connection timeouted for {} attempts... "
+                        "Possibly internet problem?".format(max_attempts)
+                    )
+                    raise
+                refresh_attempt += 1
+            except StaleElementReferenceException:
+                if stale_attempt >= max_attempts:
+                    print(
+                        "\r\nERROR: Elements are not stable to retrieve after {} "
+                        "attempts... Possibly internet problem?".format(max_attempts)
+                    )
+                    raise
+                stale_attempt += 1
 
-        def from_json_mp4():
-            mp4_files = self.video_json["lesson"]["video"]["media"]["media"]["current"][
-                "primaryFiles"
-            ]
-            urls = [obj["s3Url"] for obj in mp4_files]
-            if len(urls) == 0:
-                raise ValueError("Cannot find mp4 urls")
-            # usually hd is the last one. so we will sort in reverse order
-            return next(reversed(urls))
-
-        # try different methods in series, first the preferred ones, then the more
-        # obscure ones.
-        try:
-            _LOGGER.debug("Trying from_json_mp4 method")
-            return from_json_mp4()
-        except Exception as e:
-            _LOGGER.debug(f"Encountered exception: {e}")
-        try:
-            _LOGGER.debug("Trying from_json_m3u8 method")
-            m3u8urls = from_json_m3u8()
-        except Exception as e:
-            _LOGGER.debug(f"Encountered exception: {e}")
-        try:
-            _LOGGER.debug("Trying brute_force_all_mp4 method")
-            return brute_force_get_mp4_url()
-        except Exception as e:
-            _LOGGER.debug(f"Encountered exception: { e}")
-        try:
-            _LOGGER.debug("Trying brute_force_all_m3u8 method")
-            m3u8urls = brute_force_get_url(suffix="m3u8")
-        except Exception as e:
-            _LOGGER.debug(f"Encountered exception: {e}")
-            _LOGGER.debug("All methods had been exhausted.")
-            print("Tried all methods to retrieve videos but all had failed!")
-            raise
+    @staticmethod
+    def _find_urls(page_source, suffix):
+        return set(re.findall('https://[^,"]*?[.]{}'.format(suffix), page_source))
+
+    def _url_from_page_mp4(self, page_source):
+        """Forcefully try to find all .mp4 url in the page source"""
+        urls = self._find_urls(page_source, "mp4")
+        if len(urls) == 0:
+            raise ValueError("None were found.")
+        # in many cases, there would be urls in the format of http://xxx.{hd1,hd2,sd1,sd2}
+        # I'm not sure what does the 1 and 2 in hd1,hd2 stands for, but hd and sd should means
+        # high or low definition.
+        # Some university uses hd1 and hd2 for their alternative feeds, use flag `-a`
+        # to download both feeds.
+        # Let's prioritise hd over sd, and 1 over 2 (the latter is arbitary)
+        # which happens to be the natual order of letter anyway, so we can simply use sorted.
+        return sorted(urls)[:2]
+
+    def _url_from_page_m3u8(self, page_source):
+        return self._select_m3u8_urls(self._find_urls(page_source, "m3u8"))
 
+    @staticmethod
+    def _select_m3u8_urls(m3u8urls):
         # find one that has audio + video
         m3u8urls = [url for url in m3u8urls if url.endswith("av.m3u8")]
         if len(m3u8urls) == 0:
-            print(
-                "No audio+video m3u8 files found! Skipping...\n"
-                "This can either be (i) Credential failure? (ii) Logic error "
-                "in the script. (iii) This lecture only provides audio?\n"
-                "This script is hard-coded to download audio+video. "
-                "If this is your intended behaviour, "
-                "please contact the author."
-            )
-            return False
+            raise ValueError("No audio+video m3u8 urls")
         # There could exists multiple m3u8 files
         # (e.g. .../s1_av.m3u8, .../s2_av.m3u8, etc.) Probably to refer to
         # different quality?? We will set it to always prefer higher number.
@@ -535,7 +644,7 @@ class EchoCloudVideo(EchoVideo):
         # just use text sorting to get the higher number.
         # Some university have two different video feeds, use flag `-a` to
         # download both feeds.
-        m3u8urls = list(reversed(m3u8urls))
+        m3u8urls = sorted(m3u8urls, reverse=True)
         return m3u8urls[:2]
 
     def _extract_date(self, video_json):
@@ -20,6 +20,10 @@ setuptools.setup(
     },
     python_requires=">=2.7",
     install_requires=required,
+    extras_require={
+        # the asyncio backend (--backend asyncio)
+        "asyncio": ["aiohttp>=3.7"],
+    },
     platforms="linux, macos, windows",
     entry_points={
         "console_scripts": [
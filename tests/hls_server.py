@@ -0,0 +1,54 @@
+"""A local HLS server for the tests: ``SEGMENTS`` segments of ``SEGMENT_SIZE``."""
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SEGMENTS = 40
+SEGMENT_SIZE = 200 * 1000
+
+
+def segment(index):
+    return bytes([index % 256]) * SEGMENT_SIZE
+
+
+def content():
+    """What the downloaded lecture should contain."""
+    return b"".join(segment(i) for i in range(SEGMENTS))
+
+
+class Handler(BaseHTTPRequestHandler):
+    # subclasses return a (status, body) to send instead, None to serve it
+    def intercept(self):
+        return None
+
+    def do_GET(self):
+        self.server.requests.append(self.path)
+        response = self.intercept()
+        if response is not None:
+            self._send(*response)
+        elif self.path == "/index.m3u8":
+            lines = ["#EXTM3U", "#EXT-X-TARGETDURATION:6"]
+            for i in range(SEGMENTS):
+                lines += ["#EXTINF:6.0,", "seg{}.ts".format(i)]
+            lines.append("#EXT-X-ENDLIST")
+            self._send(200, "\n".join(lines).encode())
+        else:
+            self._send(200, segment(int(self.path[4:].split(".")[0])))
+
+    def _send(self, status, body):
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def serve(handler):
+    """Starts serving with ``handler`` in the background, returns the server."""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    # paths of the requests made, in order
+    server.requests = []
+    server.url = "http://127.0.0.1:{}/index.m3u8".format(server.server_port)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
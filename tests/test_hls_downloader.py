@@ -0,0 +1,54 @@
+import unittest
+
+from echo360.hls_downloader import coalesce_byteranges
+from echo360.m3u8 import ByteRange
+
+
+def ranges(parts):
+    return [(url, None if r is None else (r.offset, r.length)) for url, r in parts]
+
+
+class CoalesceByterangesTest(unittest.TestCase):
+    def test_adjacent_ranges_of_a_resource_are_merged(self):
+        parts = [
+            ("a.ts", ByteRange(100, 0)),
+            ("a.ts", ByteRange(50, 100)),
+            ("a.ts", ByteRange(25, 150)),
+        ]
+        self.assertEqual(ranges(coalesce_byteranges(parts)), [("a.ts", (0, 175))])
+
+    def test_gaps_and_other_resources_are_kept_apart(self):
+        parts = [
+            ("a.ts", ByteRange(100, 0)),
+            ("a.ts", ByteRange(100, 200)),
+            ("b.ts", ByteRange(100, 300)),
+        ]
+        self.assertEqual(
+            ranges(coalesce_byteranges(parts)),
+            [("a.ts", (0, 100)), ("a.ts", (200, 100)), ("b.ts", (300, 100))],
+        )
+
+    def test_parts_without_a_range_are_kept(self):
+        parts = [("a.ts", None), ("a.ts", ByteRange(100, 0)), ("b.ts", None)]
+        self.assertEqual(
+            ranges(coalesce_byteranges(parts)),
+            [("a.ts", None), ("a.ts", (0, 100)), ("b.ts", None)],
+        )
+
+    def test_merged_ranges_stay_within_max_bytes(self):
+        parts = [("a.ts", ByteRange(100, offset)) for offset in range(0, 500, 100)]
+        self.assertEqual(
+            ranges(coalesce_byteranges(parts, max_bytes=250)),
+            [("a.ts", (0, 200)), ("a.ts", (200, 200)), ("a.ts", (400, 100))],
+        )
+
+    def test_order_is_kept(self):
+        parts = [("a.ts", ByteRange(100, 100)), ("a.ts", ByteRange(100, 0))]
+        self.assertEqual(
+            ranges(coalesce_byteranges(parts)),
+            [("a.ts", (100, 100)), ("a.ts", (0, 100))],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,129 @@
+import unittest
+
+from echo360 import m3u8
+
+BASE_URL = "https://content.echo360.org/0000/hls/index.m3u8"
+
+# the layouts from the module docstring
+SHARED_AUDIO_MASTER = """#EXTM3U
+#EXT-X-VERSION:3
+#EXT-X-STREAM-INF:BANDWIDTH=102092,RESOLUTION=1280x756,CODECS="avc1.640029,mp4a.40.2",AUDIO="group_audio"
+s1q1.m3u8
+#EXT-X-MEDIA:TYPE=AUDIO,GROUP-ID="group_audio",NAME="audio_0",DEFAULT=YES,URI="s0q0.m3u8"
+"""
+
+AUDIO_PER_QUALITY_MASTER = """#EXTM3U
+#EXT-X-MEDIA:TYPE=AUDIO,GROUP-ID="q0",NAME="audio_0",DEFAULT=YES,URI="s0q0.m3u8"
+#EXT-X-MEDIA:TYPE=AUDIO,GROUP-ID="q1",NAME="audio_1",DEFAULT=YES,URI="s0q1.m3u8"
+#EXT-X-STREAM-INF:BANDWIDTH=500000,RESOLUTION=640x378,AUDIO="q0"
+s1q0.m3u8
+#EXT-X-STREAM-INF:BANDWIDTH=1500000,RESOLUTION=1280x756,AUDIO="q1"
+s1q1.m3u8
+"""
+
+MEDIA = """#EXTM3U
+#EXT-X-TARGETDURATION:6
+#EXT-X-MEDIA-SEQUENCE:7
+#EXTINF:6.0,first
+s1q1_0.ts
+#EXTINF:5.5,
+#EXT-X-DISCONTINUITY
+s1q1_1.ts?token=abc
+#EXT-X-ENDLIST
+"""
+
+
+class MasterPlaylistTest(unittest.TestCase):
+    def test_shared_audio_group(self):
+        playlist = m3u8.parse(SHARED_AUDIO_MASTER, BASE_URL)
+        self.assertIsInstance(playlist, m3u8.MasterPlaylist)
+        [variant] = playlist.variants
+        self.assertEqual(variant.uri, "https://content.echo360.org/0000/hls/s1q1.m3u8")
+        self.assertEqual(variant.bandwidth, 102092)
+        self.assertEqual(variant.resolution, (1280, 756))
+        self.assertEqual(variant.codecs, ["avc1.640029", "mp4a.40.2"])
+        self.assertEqual(
+            playlist.audio_for(variant),
+            "https://content.echo360.org/0000/hls/s0q0.m3u8",
+        )
+
+    def test_audio_group_per_quality(self):
+        playlist = m3u8.parse(AUDIO_PER_QUALITY_MASTER, BASE_URL)
+        self.assertEqual([v.audio for v in playlist.variants], ["q0", "q1"])
+        self.assertEqual(
+            playlist.audio_for(playlist.default_variant()),
+            "https://content.echo360.org/0000/hls/s0q1.m3u8",
+        )
+
+    def test_nested_media_playlist(self):
+        playlist = m3u8.parse("#EXTM3U\nmedia.m3u8\n", BASE_URL)
+        self.assertIsInstance(playlist, m3u8.MasterPlaylist)
+        self.assertEqual(
+            [v.uri for v in playlist.variants],
+            ["https://content.echo360.org/0000/hls/media.m3u8"],
+        )
+
+
+class MediaPlaylistTest(unittest.TestCase):
+    def test_segments(self):
+        playlist = m3u8.parse(MEDIA, BASE_URL)
+        self.assertIsInstance(playlist, m3u8.MediaPlaylist)
+        self.assertEqual(playlist.target_duration, 6.0)
+        self.assertEqual(playlist.media_sequence, 7)
+        self.assertTrue(playlist.endlist)
+        self.assertEqual(playlist.duration, 11.5)
+        first, second = playlist.segments
+        self.assertEqual(first.uri, "https://content.echo360.org/0000/hls/s1q1_0.ts")
+        self.assertEqual(first.title, "first")
+        self.assertEqual(first.sequence, 7)
+        self.assertFalse(first.discontinuity)
+        self.assertEqual(second.uri.rsplit("/", 1)[1], "s1q1_1.ts?token=abc")
+        self.assertEqual(second.sequence, 8)
+        self.assertTrue(second.discontinuity)
+
+    def test_byterange_without_offset_follows_the_previous_range(self):
+        playlist = m3u8.parse(
+            "#EXTM3U\n"
+            "#EXTINF:6.0,\n#EXT-X-BYTERANGE:1000@500\nall.ts\n"
+            "#EXTINF:6.0,\n#EXT-X-BYTERANGE:2000\nall.ts\n",
+            BASE_URL,
+        )
+        first, second = [s.byterange for s in playlist.segments]
+        self.assertEqual((first.length, first.offset, first.end), (1000, 500, 1499))
+        self.assertEqual((second.length, second.offset), (2000, 1500))
+
+    def test_bytes_with_bom(self):
+        playlist = m3u8.parse(b"\xef\xbb\xbf" + MEDIA.encode(), BASE_URL)
+        self.assertEqual(len(playlist.segments), 2)
+
+
+class InvalidPlaylistTest(unittest.TestCase):
+    def assertInvalid(self, text):
+        with self.assertRaises(m3u8.M3U8Error):
+            m3u8.parse(text, BASE_URL)
+
+    def test_not_a_playlist(self):
+        self.assertInvalid("<html></html>")
+        self.assertInvalid("")
+
+    def test_invalid_target_duration(self):
+        self.assertInvalid("#EXTM3U\n#EXT-X-TARGETDURATION:six\n")
+
+    def test_invalid_media_sequence(self):
+        self.assertInvalid("#EXTM3U\n#EXT-X-MEDIA-SEQUENCE:1.5\n")
+
+    def test_invalid_duration(self):
+        self.assertInvalid("#EXTM3U\n#EXTINF:long,\nseg.ts\n")
+
+    def test_byterange_without_offset_or_previous_range(self):
+        self.assertInvalid("#EXTM3U\n#EXTINF:6.0,\n#EXT-X-BYTERANGE:1000\nall.ts\n")
+
+    def test_map_without_uri(self):
+        self.assertInvalid('#EXTM3U\n#EXT-X-MAP:BYTERANGE="100@0"\n')
+
+    def test_m3u8_error_is_a_value_error(self):
+        self.assertTrue(issubclass(m3u8.M3U8Error, ValueError))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,61 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from echo360.concurrency import AIMDController
+from echo360.hls_downloader import Downloader
+from echo360.memory_budget import MemoryBudget
+
+import hls_server
+
+
+class Handler(hls_server.Handler):
+    failed_head = False
+
+    def intercept(self):
+        if self.path == "/seg0.ts" and not Handler.failed_head:
+            # the head is retried after the others took the budget
+            Handler.failed_head = True
+            return 503, b""
+        return None
+
+
+class MemoryBudgetDeadlockTest(unittest.TestCase):
+    def setUp(self):
+        Handler.failed_head = False
+        self.server = hls_server.serve(Handler)
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.dir)
+
+    def test_budget_below_window_does_not_stall_the_head(self):
+        # the reorder window (32 MiB) holds far more than the budget (1 MB)
+        budget = MemoryBudget("1M")
+        downloader = Downloader(
+            8,
+            controller=AIMDController(floor=3, ceiling=3),
+            memory_budget=budget,
+        )
+        thread = threading.Thread(
+            target=downloader.run,
+            args=(self.server.url, self.dir),
+            kwargs={"convert_to_mp4": False, "name": "lecture"},
+            daemon=True,
+        )
+        thread.start()
+        thread.join(30)
+        self.assertFalse(thread.is_alive(), "download stalled")
+        with open(downloader.result_file_name, "rb") as f:
+            self.assertEqual(f.read(), hls_server.content())
+        self.assertEqual(budget.used, 0)
+        # no temp files left behind
+        self.assertEqual(os.listdir(self.dir), ["lecture_all.ts"])
+
+
+if __name__ == "__main__":
+    unittest.main()
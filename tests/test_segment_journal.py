@@ -0,0 +1,69 @@
+import json
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from echo360.echo_exceptions import HlsDownloaderError
+from echo360.hls_downloader import Downloader
+from echo360.retry import RetryPolicy
+
+import hls_server
+
+
+class Handler(hls_server.Handler):
+    broken = True
+
+    def intercept(self):
+        if self.path == "/seg0.ts" and Handler.broken:
+            # fails once the others have arrived, so they're in the window
+            time.sleep(0.5)
+            return 404, b""
+        return None
+
+
+class ResumeAfterFailureTest(unittest.TestCase):
+    def setUp(self):
+        Handler.broken = True
+        self.server = hls_server.serve(Handler)
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.dir)
+
+    def run_downloader(self, **kwargs):
+        downloader = Downloader(4, **kwargs)
+        downloader.run(self.server.url, self.dir, convert_to_mp4=False, name="lec")
+        return downloader
+
+    def test_resume_keeps_the_window_of_the_failed_run(self):
+        with self.assertRaises(HlsDownloaderError):
+            self.run_downloader(retry_policy=RetryPolicy(max_attempts=1))
+        journal_path = os.path.join(self.dir, "lec_all.ts.journal")
+        with open(journal_path) as f:
+            journal = json.load(f)
+        self.assertEqual(journal["written"], 0)
+        kept = {int(index) for index in journal["window"]}
+        self.assertTrue(kept)
+        self.assertTrue(os.path.exists(os.path.join(self.dir, "lec_all.ts.window")))
+
+        Handler.broken = False
+        del self.server.requests[:]
+        downloader = self.run_downloader()
+        refetched = {
+            int(path[4:].split(".")[0])
+            for path in self.server.requests
+            if path.endswith(".ts")
+        }
+        self.assertIn(0, refetched)
+        self.assertFalse(refetched & kept)
+        with open(downloader.result_file_name, "rb") as f:
+            self.assertEqual(f.read(), hls_server.content())
+        self.assertEqual(os.listdir(self.dir), ["lec_all.ts"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,75 @@
+import unittest
+
+from echo360 import m3u8
+from echo360.variant_policy import LOWEST, VariantPolicy, parse_resolution
+
+MASTER = """#EXTM3U
+#EXT-X-STREAM-INF:BANDWIDTH=800000,RESOLUTION=640x360,CODECS="avc1.4d401e,mp4a.40.2"
+low.m3u8
+#EXT-X-STREAM-INF:BANDWIDTH=3000000,RESOLUTION=1920x1080,CODECS="hvc1.1.6.L120,mp4a.40.2"
+high.m3u8
+#EXT-X-STREAM-INF:BANDWIDTH=2000000,RESOLUTION=1280x720,CODECS="avc1.640029,mp4a.40.2"
+mid.m3u8
+#EXT-X-STREAM-INF:BANDWIDTH=64000,CODECS="mp4a.40.2"
+audio.m3u8
+"""
+
+
+def select(text=MASTER, **kwargs):
+    variant = VariantPolicy(**kwargs).select(m3u8.parse(text))
+    return variant.uri if variant is not None else None
+
+
+class VariantPolicyTest(unittest.TestCase):
+    def test_highest_by_default(self):
+        self.assertEqual(select(), "high.m3u8")
+
+    def test_lowest_skips_audio_only_variants(self):
+        self.assertEqual(select(prefer=LOWEST), "low.m3u8")
+
+    def test_max_resolution(self):
+        self.assertEqual(select(max_resolution="720p"), "mid.m3u8")
+        self.assertEqual(select(max_resolution="1280x720"), "mid.m3u8")
+
+    def test_bandwidth_limits(self):
+        self.assertEqual(select(max_bandwidth="2M"), "mid.m3u8")
+        self.assertEqual(select(prefer=LOWEST, min_bandwidth="1M"), "mid.m3u8")
+
+    def test_codecs_only_constrain_the_kinds_named(self):
+        # avc1 alone still allows the muxed mp4a audio
+        self.assertEqual(select(codecs="avc1"), "mid.m3u8")
+        self.assertEqual(select(codecs="avc1,mp4a"), "mid.m3u8")
+        self.assertEqual(select(codecs="hvc1"), "high.m3u8")
+
+    def test_closest_when_nothing_qualifies(self):
+        # a cap exceeded by all: the least
+        self.assertEqual(select(max_resolution="240p"), "low.m3u8")
+        # a minimum or codecs nobody meets: the best
+        self.assertEqual(select(min_bandwidth="10M"), "high.m3u8")
+        self.assertEqual(select(codecs="vp09"), "high.m3u8")
+
+    def test_ties_go_to_the_variant_listed_last(self):
+        text = "#EXTM3U\n#EXT-X-STREAM-INF:\na.m3u8\n#EXT-X-STREAM-INF:\nb.m3u8\n"
+        self.assertEqual(select(text), "b.m3u8")
+        self.assertEqual(select(text, prefer=LOWEST), "b.m3u8")
+
+    def test_unknown_bandwidth_is_not_within_limits(self):
+        text = (
+            "#EXTM3U\n"
+            "#EXT-X-STREAM-INF:RESOLUTION=1920x1080\nnested.m3u8\n"
+            "#EXT-X-STREAM-INF:BANDWIDTH=900000,RESOLUTION=640x360\nlow.m3u8\n"
+        )
+        self.assertEqual(select(text, max_bandwidth="1M"), "low.m3u8")
+
+    def test_no_variants(self):
+        self.assertIsNone(VariantPolicy().select(m3u8.MasterPlaylist()))
+
+    def test_invalid_arguments(self):
+        with self.assertRaises(ValueError):
+            VariantPolicy(prefer="best")
+        with self.assertRaises(ValueError):
+            parse_resolution("HD")
+
+
+if __name__ == "__main__":
+    unittest.main()